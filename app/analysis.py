@@ -0,0 +1,205 @@
+import argparse
+import datetime
+import gzip
+import math
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, fields
+from typing import Iterable, Iterator, Tuple, TextIO
+
+import numpy as np
+
+from app.recording import LOG_LINE, LOG_DATE_FORMAT, LOG_EVENT_NAMES, EventType
+
+LOG_FILENAME = re.compile(r"^logs_(?P<user>.*)_\d{4}-\d\d-\d\d_\d\d-\d\d-\d\d\.log(?:\.gz)?$")
+LOG_EXTENSIONS = (".log", ".log.gz")
+
+
+class DistanceTimeline:
+    # Средняя дистанция курсор - цель по интервалам времени от начала сессии.
+    # Интервалов не больше bins: когда время выходит за последний, соседние интервалы
+    # сливаются попарно и ширина удваивается, так что память не зависит от длины сессии
+    BINS = 64
+    WIDTH_S = 1.0
+
+    def __init__(self, bins: int = BINS, width: float = WIDTH_S):
+        self._sums = [0.0] * bins
+        self._counts = [0] * bins
+        self._width = width
+
+    def add(self, seconds: float, distance: float):
+        index = int(seconds // self._width)
+        while index >= len(self._sums):
+            self._merge()
+            index = int(seconds // self._width)
+        self._sums[index] += distance
+        self._counts[index] += 1
+
+    def _merge(self):
+        half = len(self._sums) // 2
+        self._sums = [self._sums[i] + self._sums[i + 1] for i in range(0, 2 * half, 2)] + [0.0] * half
+        self._counts = [self._counts[i] + self._counts[i + 1] for i in range(0, 2 * half, 2)] + [0] * half
+        self._width *= 2
+
+    def means(self) -> Tuple[float, ...]:
+        # NaN - в интервале не было ни одного замера
+        return tuple(total / count if count else math.nan for total, count in zip(self._sums, self._counts))
+
+    @property
+    def width(self) -> float:
+        return self._width
+
+
+@dataclass(frozen=True)
+class SessionMetrics:
+    # Метрики одного лога. Координаты в логе - точки окна, поэтому длина пути и дистанции в пикселях
+    session: str
+    user: str
+    start: float  # Время первого события, секунды Unix; NaN, если событий нет
+    duration_s: float
+    time_to_target_s: float  # От первого события до первого достижения цели; NaN, если цель не достигнута
+    targets_reached: int
+    path_length: float
+    wall_hits: int  # Строки о столкновениях пишутся в лог не всегда: у старых логов здесь 0
+    cursor_events: int
+    target_events: int
+    distance_mean: float
+    distance_min: float
+    distance_final: float
+    distance_bin_s: float  # Ширина интервала в distance
+    distance: Tuple[float, ...]  # DistanceTimeline.means()
+
+
+def open_log(filename: str) -> TextIO:
+    # Архивы логов могут быть сжаты gzip; битые байты не останавливают разбор
+    if filename.endswith(".gz"):
+        return gzip.open(filename, "rt", encoding="UTF-8", errors="replace")
+    return open(filename, encoding="UTF-8", errors="replace")
+
+
+def analyze_log(filename: str) -> SessionMetrics:
+    # Один проход по строкам лога: в памяти только накопители, а не события
+    start = end = reached = math.nan
+    targets_reached = wall_hits = cursor_events = target_events = 0
+    path_length = distance_sum = 0.0
+    distance_count = 0
+    distance_min = distance_final = math.nan
+    cursor = target = None
+    timeline = DistanceTimeline()
+    # Время в логе с точностью до секунды: подряд идущие строки обычно с одной меткой
+    last_time, timestamp = None, math.nan
+
+    with open_log(filename) as log:
+        for line in log:
+            match = LOG_LINE.match(line.rstrip("\n"))
+            if match is None:
+                continue
+            if match["time"] != last_time:
+                last_time = match["time"]
+                timestamp = datetime.datetime.strptime(last_time, LOG_DATE_FORMAT).timestamp()
+                if math.isnan(start):
+                    start = timestamp
+                end = timestamp
+
+            if match["name"]:
+                point = int(match["x"]), int(match["y"])
+                if LOG_EVENT_NAMES[match["name"]] == EventType.CURSOR:
+                    if cursor is not None:
+                        path_length += math.hypot(point[0] - cursor[0], point[1] - cursor[1])
+                    cursor = point
+                    cursor_events += 1
+                    continue
+                target = point
+                target_events += 1
+                # Цель пишется каждый кадр: дистанция меряется по этим отметкам
+                if cursor is not None:
+                    distance = math.hypot(target[0] - cursor[0], target[1] - cursor[1])
+                    distance_sum += distance
+                    distance_count += 1
+                    distance_min = distance if math.isnan(distance_min) else min(distance_min, distance)
+                    distance_final = distance
+                    timeline.add(timestamp - start, distance)
+            elif match["hit_x"]:
+                wall_hits += 1
+            else:
+                targets_reached += 1
+                if math.isnan(reached):
+                    reached = timestamp
+
+    name = os.path.basename(filename)
+    user = LOG_FILENAME.match(name)
+    return SessionMetrics(session=name,
+                          user=user["user"] if user else "",
+                          start=start,
+                          duration_s=end - start,
+                          time_to_target_s=reached - start,
+                          targets_reached=targets_reached,
+                          path_length=path_length,
+                          wall_hits=wall_hits,
+                          cursor_events=cursor_events,
+                          target_events=target_events,
+                          distance_mean=distance_sum / distance_count if distance_count else math.nan,
+                          distance_min=distance_min,
+                          distance_final=distance_final,
+                          distance_bin_s=timeline.width,
+                          distance=timeline.means())
+
+
+def iter_logs(paths: Iterable[str]) -> Iterator[str]:
+    # Файлы логов по списку файлов и каталогов, каталоги - рекурсивно, в устойчивом порядке
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.endswith(LOG_EXTENSIONS):
+                    yield os.path.join(root, name)
+
+
+def analyze_logs(filenames: Iterable[str], workers: int = None, chunksize: int = 8) -> Iterator[SessionMetrics]:
+    # Логи разбираются в пуле процессов, результаты приходят в порядке файлов.
+    # Каждый процесс читает свой файл потоком, обратно передаются только метрики
+    if workers == 1:
+        yield from map(analyze_log, filenames)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(analyze_log, filenames, chunksize=chunksize)
+
+
+def write_summary(filename: str, sessions: Iterable[SessionMetrics]) -> int:
+    # Колоночная сводка в .npz: по массиву на метрику, distance - матрица сессии x интервалы.
+    # Читается через np.load(filename)[<метрика>]. Возвращает число сессий
+    columns = {field.name: [] for field in fields(SessionMetrics)}
+    for session in sessions:
+        for name, column in columns.items():
+            column.append(getattr(session, name))
+    arrays = {}
+    for name, column in columns.items():
+        if name == "distance":
+            arrays[name] = np.array(column, dtype=np.float32).reshape(len(column), DistanceTimeline.BINS)
+        elif name in ("session", "user"):
+            arrays[name] = np.array(column, dtype=str)
+        else:
+            arrays[name] = np.array(column)
+    with open(filename, "wb") as f:
+        np.savez(f, **arrays)
+    return len(columns["session"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize session .log files into a columnar .npz file")
+    parser.add_argument("paths", nargs="+", help="session logs or directories with them")
+    parser.add_argument("--output", default="summary.npz", help="summary file")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    args = parser.parse_args()
+    started = time.perf_counter()
+    count = write_summary(args.output, analyze_logs(iter_logs(args.paths), args.workers))
+    print(f"{count} sessions -> {args.output} in {time.perf_counter() - started:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 from .map_ import Map, Rect, Point
-from .loaders import JsonLoader
+from .loaders import JsonLoader, StreamingJsonLoader
 
 
-__all__ = ['Map', 'Rect', 'Point', 'JsonLoader']
+__all__ = ['Map', 'Rect', 'Point', 'JsonLoader', 'StreamingJsonLoader']
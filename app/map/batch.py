@@ -0,0 +1,210 @@
+from typing import List, Dict, Tuple
+
+import numpy as np
+
+from .map_ import AbstractEngine, Circle, Map, Point, Rect, SideStep, MovedBoxes
+
+SIDES = tuple(SideStep)
+SIDE_STEPS = np.array([side.value for side in SIDES], dtype=np.int64)
+ALL_SIDES_MASK = (1 << len(SIDES)) - 1
+SIDE_INDEX = {side.value: i for i, side in enumerate(SIDES)}
+
+# FREE_SIDES[mask, k] - индекс k-й свободной стороны при маске занятых сторон mask,
+# в том же порядке, в котором SequentialEngine выбирает из списка свободных сторон
+FREE_COUNT = np.zeros(ALL_SIDES_MASK + 1, dtype=np.int64)
+FREE_SIDES = np.zeros((ALL_SIDES_MASK + 1, len(SIDES)), dtype=np.int64)
+for _mask in range(ALL_SIDES_MASK + 1):
+    _free = [i for i in range(len(SIDES)) if not _mask >> i & 1]
+    FREE_COUNT[_mask] = len(_free)
+    FREE_SIDES[_mask, :len(_free)] = _free
+
+
+class BatchEngine(AbstractEngine):
+    # Движок в виде структуры массивов: за один шаг продвигаются все объекты сразу.
+    # Пересечение квадрата объекта с границами считается по таблицам префиксных сумм
+    # растра границ, поэтому проверка не зависит от числа границ. Таблицы строятся
+    # по кускам CHUNK_SIZE x CHUNK_SIZE при первом появлении объекта в куске, как плитки
+    # DistanceField: память зависит от того, где бывают объекты, а не от площади мира.
+    CHUNK_SIZE = 64
+    INITIAL_CHUNKS = 64
+    MAX_CHUNKS = 4096
+    _circles: List[Circle]
+    _x: np.ndarray
+    _y: np.ndarray
+    _vx: np.ndarray
+    _vy: np.ndarray
+    _radius: np.ndarray
+    _sides: np.ndarray
+    _apron: int
+    _tables: np.ndarray
+    _tables_count: int
+    _slots: Dict[Tuple[int, int], int]
+    _slot_keys: np.ndarray
+    _slot_values: np.ndarray
+
+    def __init__(self, map_: Map):
+        super().__init__(map_)
+        self._rng = np.random.default_rng(map_.random.getrandbits(64))
+        self._load(map_.targets)
+        self.rebuild()
+
+    def _load(self, circles: List[Circle]):
+        self._circles = circles
+        self._x = np.array([c.pos.x for c in circles], dtype=np.int64)
+        self._y = np.array([c.pos.y for c in circles], dtype=np.int64)
+        self._vx = np.array([c.speed_vector.x for c in circles], dtype=np.int64)
+        self._vy = np.array([c.speed_vector.y for c in circles], dtype=np.int64)
+        self._radius = np.array([c.radius for c in circles], dtype=np.int64)
+        self._sides = np.array([sum(1 << i for i, side in enumerate(SIDES) if side in c.bounding_sides)
+                                for c in circles], dtype=np.int8)
+
+    def rebuild(self):
+        # Таблица куска захватывает полосу шириной apron за его правым и нижним краями:
+        # квадрат объекта, левый верхний угол которого лежит в куске, целиком попадает
+        # в таблицу этого куска, и проверка остаётся одной выборкой четырёх сумм
+        size = self.CHUNK_SIZE
+        self._apron = 2 * int(self._radius.max(initial=0))
+        span = size + self._apron
+        # Номер таблицы по куску (cx, cy), как плитки DistanceField: 0 - пустая таблица,
+        # куска без записи ещё не было. Пустые куски тоже в счёте MAX_CHUNKS
+        self._slots = {}
+        self._index_slots()
+        # Сумма по таблице не больше span ** 2, при обычном радиусе хватает uint16
+        dtype = np.uint16 if span * span <= np.iinfo(np.uint16).max else np.int32
+        self._tables = np.zeros((self.INITIAL_CHUNKS, span + 1, span + 1), dtype=dtype)
+        self._tables_count = 1
+
+    @staticmethod
+    def _chunk_keys(cx, cy):
+        # Кусок (cx, cy) одним числом, для поиска по отсортированным ключам
+        return (cx << 32) + (cy & 0xFFFFFFFF)
+
+    def _index_slots(self, chunks: List[Tuple[int, int]] = ()):
+        # Отсортированные ключи кусков и номера их таблиц для векторного поиска по _slots.
+        # Новые куски chunks вливаются в уже отсортированные, без обхода всего словаря.
+        # Последний ключ - заглушка, чтобы searchsorted не выходил за массив
+        if not chunks:
+            self._slot_keys = np.array([np.iinfo(np.int64).max], dtype=np.int64)
+            self._slot_values = np.array([-1], dtype=np.int64)
+            return
+        keys = np.concatenate((self._slot_keys[:-1],
+                               self._chunk_keys(*np.array(chunks, dtype=np.int64).T), self._slot_keys[-1:]))
+        values = np.concatenate((self._slot_values[:-1],
+                                 np.array([self._slots[chunk] for chunk in chunks], dtype=np.int64),
+                                 self._slot_values[-1:]))
+        order = np.argsort(keys, kind="stable")
+        self._slot_keys, self._slot_values = keys[order], values[order]
+
+    def _lookup(self, cx: np.ndarray, cy: np.ndarray) -> np.ndarray:
+        keys = self._chunk_keys(cx, cy)
+        index = np.searchsorted(self._slot_keys, keys)
+        return np.where(self._slot_keys[index] == keys, self._slot_values[index], -1)
+
+    def _build_tables(self, cx: np.ndarray, cy: np.ndarray, absent: np.ndarray):
+        # Недостающие (по маске absent) таблицы кусков (cx, cy) строятся по индексу границ.
+        # Если кусков стало бы больше MAX_CHUNKS, все они сбрасываются: остаются только нужные сейчас
+        missing = set(zip(cx[absent].tolist(), cy[absent].tolist()))
+        if len(self._slots) + len(missing) > self.MAX_CHUNKS:
+            self._slots = {}
+            self._index_slots()
+            self._tables_count = 1
+            missing = set(zip(cx.tolist(), cy.tolist()))
+        size, span = self.CHUNK_SIZE, self.CHUNK_SIZE + self._apron
+        for chunk in missing:
+            x, y = chunk[0] * size, chunk[1] * size
+            rects = self._map.border_index.query(x, y, x + span, y + span)
+            if not rects:
+                self._slots[chunk] = 0
+                continue
+            grid = np.zeros((span, span), dtype=np.uint8)
+            for r in rects:
+                grid[max(r.corner.y - y, 0):max(r.corner.y + r.height - y, 0),
+                     max(r.corner.x - x, 0):max(r.corner.x + r.width - x, 0)] = 1
+            if self._tables_count == len(self._tables):
+                self._tables = np.concatenate((self._tables, np.zeros_like(self._tables)))
+            dtype = self._tables.dtype
+            self._tables[self._tables_count, 1:, 1:] = grid.cumsum(axis=0, dtype=dtype).cumsum(axis=1, dtype=dtype)
+            self._slots[chunk] = self._tables_count
+            self._tables_count += 1
+        self._index_slots(list(missing))
+
+    def _collide(self, x: np.ndarray, y: np.ndarray, radius: np.ndarray) -> np.ndarray:
+        # То же условие, что Rect.collide: квадрат [x - r, x + r) x [y - r, y + r)
+        size = self.CHUNK_SIZE
+        x0, y0 = x - radius, y - radius
+        cx, cy = x0 // size, y0 // size
+        slot = self._lookup(cx, cy)
+        absent = slot < 0
+        if absent.any():
+            self._build_tables(cx, cy, absent)
+            slot = self._lookup(cx, cy)
+        x0, y0 = x0 - cx * size, y0 - cy * size
+        x1, y1 = x0 + 2 * radius, y0 + 2 * radius
+        table = self._tables
+        # Разности считаются по модулю типа таблицы, но сама сумма квадрата в него помещается
+        return table[slot, y1, x1] - table[slot, y0, x1] - table[slot, y1, x0] + table[slot, y0, x0] != 0
+
+    def process(self) -> MovedBoxes:
+        speed = np.fromiter((c.speed for c in self._circles), dtype=np.int64, count=len(self._circles))
+        start_x, start_y = self._x.copy(), self._y.copy()
+        for step in range(int(speed.max(initial=0))):
+            active = np.flatnonzero(speed > step)
+            x, y, radius = self._x[active], self._y[active], self._radius[active]
+            sides = np.zeros(len(active), dtype=np.int8)
+            for bit, (dx, dy) in enumerate(SIDE_STEPS):
+                sides |= self._collide(x + dx, y + dy, radius).astype(np.int8) << bit
+
+            changed = sides != self._sides[active]
+            turning = changed & (sides != ALL_SIDES_MASK)
+            if turning.any():
+                index, mask = active[turning], sides[turning]
+                choice = (self._rng.random(len(index)) * FREE_COUNT[mask]).astype(np.int64)
+                side = FREE_SIDES[mask, choice]
+                self._vx[index] = SIDE_STEPS[side, 0]
+                self._vy[index] = SIDE_STEPS[side, 1]
+            for i in active[changed & (sides == ALL_SIDES_MASK)]:
+                self._push_out_at(int(i))
+
+            self._sides[active] = sides
+            self._x[active] += self._vx[active]
+            self._y[active] += self._vy[active]
+        self._store()
+        boxes = self._moved_boxes(start_x, start_y)
+        for i in self._collide_objects():
+            vector = self._circles[i].speed_vector
+            self._vx[i], self._vy[i] = vector.x, vector.y
+            # Как в SequentialEngine: направление в границу сбрасывает соседние стороны
+            side = SIDE_INDEX.get(vector.to_tuple())
+            if side is not None and self._sides[i] >> side & 1:
+                self._sides[i] = 0
+        return boxes
+
+    def _moved_boxes(self, start_x: np.ndarray, start_y: np.ndarray) -> MovedBoxes:
+        moved = np.flatnonzero((start_x != self._x) | (start_y != self._y))
+        boxes = []
+        for x0, y0, x1, y1, radius in zip(start_x[moved].tolist(), start_y[moved].tolist(),
+                                          self._x[moved].tolist(), self._y[moved].tolist(),
+                                          self._radius[moved].tolist()):
+            size = radius * 2
+            boxes.append((Rect(Point(x0 - radius, y0 - radius), size, size),
+                          Rect(Point(x1 - radius, y1 - radius), size, size)))
+        return boxes
+
+    def _push_out_at(self, i: int):
+        circle = self._circles[i]
+        obj = Circle(Point(int(self._x[i]), int(self._y[i])), circle.is_target,
+                     speed=circle.speed, speed_vector=circle.speed_vector, radius=circle.radius)
+        self._push_out(obj)
+        self._x[i], self._y[i] = obj.pos.x, obj.pos.y
+
+    def _store(self):
+        for circle, x, y, vx, vy in zip(self._circles, self._x.tolist(), self._y.tolist(),
+                                        self._vx.tolist(), self._vy.tolist()):
+            pos, speed_vector = circle.pos, circle.speed_vector
+            pos.x, pos.y = x, y
+            speed_vector.x, speed_vector.y = vx, vy
+
+    def flush(self):
+        self._store()
+        for circle, mask in zip(self._circles, self._sides.tolist()):
+            circle.bounding_sides = {side for i, side in enumerate(SIDES) if mask >> i & 1}
@@ -1,8 +1,13 @@
+import hashlib
 import json
+import mmap
+import os
+import struct
 from abc import ABC, abstractmethod
-from typing import Union, TextIO
+from contextlib import suppress
+from typing import Union, TextIO, Iterator, Any, Optional
 
-from .map_ import Map, Rect, List, Point
+from .map_ import Map, Rect, List, Point, OccupancyGrid, BorderIndex, DIMENSION
 
 
 class MapLoaderException(Exception):
@@ -10,31 +15,282 @@ class MapLoaderException(Exception):
 
 
 class AbstractLoader(ABC):
+    # Сторона мира; _deserialize_file заменяет её, если размер указан в файле
+    _dimension: int = DIMENSION
+
     @abstractmethod
     def _deserialize_file(self) -> List[Rect]:
         raise NotImplementedError
 
-    def load(self) -> Map:
+    def load(self, seed: int = None) -> Map:
         borders = self._deserialize_file()
-        return Map(borders)
+        return Map(borders, seed=seed, dimension=self._dimension)
 
 
 class JsonLoader(AbstractLoader):
-    _data: dict
+    # Для файла на диске рядом кладётся скомпилированная копия (CompiledLoader),
+    # привязанная к хэшу содержимого: повторный запуск не разбирает JSON вовсе
+    _data: dict = None
+    _compiled: "CompiledLoader" = None
+    _cache_filename: str = None
+    _digest: bytes = None
 
-    def __init__(self, file: Union[str, TextIO]):
+    def __init__(self, file: Union[str, TextIO], cache: bool = True):
         if isinstance(file, str):
-            with open(file) as f:
-                self._data = json.load(f)
+            with open(file, "rb") as f:
+                content = f.read()
+            if cache:
+                self._digest = hashlib.sha256(content).digest()
+                self._cache_filename = file + CompiledLoader.EXTENSION
+                self._compiled = CompiledLoader.open_cached(self._cache_filename, self._digest)
+            if self._compiled is None:
+                self._data = json.loads(content)
         else:
             self._data = json.load(file)
 
+    def load(self, seed: int = None) -> Map:
+        if self._compiled is not None:
+            return self._compiled.load(seed)
+        map_ = super().load(seed)
+        if self._cache_filename is not None:
+            # Кэш - лишь ускорение: если записать его не удалось, карта всё равно загружена
+            with suppress(OSError):
+                CompiledLoader.write(self._cache_filename, map_, self._digest)
+        return map_
+
     def _deserialize_file(self) -> List[Rect]:
-        rects = []
+        if self._compiled is not None:
+            return self._compiled._deserialize_file()
         try:
-            for border in self._data["borders"]:
-                rects.append(Rect(corner=Point(**border["point"]),
-                                  width=border["width"], height=border["height"]))
+            borders = self._data["borders"]
         except KeyError as e:
             raise MapLoaderException(f"Incorrect map file: missing key {e}")
-        return rects
+        if "dimension" in self._data:
+            self._dimension = dimension_from_record(self._data["dimension"])
+        return [border_from_record(border, number) for number, border in enumerate(borders)]
+
+
+class StreamingJsonLoader(AbstractLoader):
+    # Читает тот же формат, что JsonLoader, но разбирает массив borders по одной записи
+    # из буфера фиксированного размера: в памяти остаются только готовые границы
+    CHUNK_SIZE = 1 << 16
+    _file: Union[str, TextIO]
+
+    def __init__(self, file: Union[str, TextIO], chunk_size: int = CHUNK_SIZE):
+        self._file = file
+        self._chunk_size = chunk_size
+
+    def _deserialize_file(self) -> List[Rect]:
+        if isinstance(self._file, str):
+            with open(self._file) as f:
+                return self._read_borders(f)
+        return self._read_borders(self._file)
+
+    def _read_borders(self, file: TextIO) -> List[Rect]:
+        borders = None
+        reader = _JsonStreamReader(file, self._chunk_size)
+        reader.expect("{")
+        if not reader.accept("}"):
+            while True:
+                key = reader.value()
+                reader.expect(":")
+                if key == "borders":
+                    borders = [border_from_record(record, number)
+                               for number, record in enumerate(reader.array_items())]
+                elif key == "dimension":
+                    self._dimension = dimension_from_record(reader.value())
+                else:
+                    reader.value()
+                if reader.accept("}"):
+                    break
+                reader.expect(",")
+        # Как и json.loads, после объекта карты допускаются только пробелы
+        reader.expect_end()
+        if borders is None:
+            raise MapLoaderException("Incorrect map file: missing key 'borders'")
+        return borders
+
+
+class CompiledLoader(AbstractLoader):
+    # Скомпилированная карта: границы, куски растра занятости и индекс границ в одном файле,
+    # который отображается в память и используется без разбора и пересчёта
+    MAGIC = b"HMIMAP02"
+    EXTENSION = ".compiled"
+    # magic, хэш исходника, размер мира, размер ячейки индекса, размер куска растра,
+    # число свободных клеток, число границ, число кусков растра, число корзин индекса,
+    # суммарная длина корзин
+    HEADER = struct.Struct("<8s32sIIIQIIII")
+    BORDER = struct.Struct("<iiii")
+    CHUNK = struct.Struct("<ii")
+    BUCKET = struct.Struct("<iiII")
+    _mmap: mmap.mmap
+
+    def __init__(self, filename: str, digest: bytes = None):
+        with open(filename, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            (magic, file_digest, self._dimension, cell_size, self._chunk_size, self._free_count, self._borders_count,
+             self._chunks_count, self._buckets_count, self._entries_count) = self.HEADER.unpack_from(self._mmap)
+        except struct.error:
+            raise MapLoaderException(f"Incorrect compiled map file: {filename}")
+        if magic != self.MAGIC:
+            raise MapLoaderException(f"Incorrect compiled map file: {filename}")
+        if digest is not None and file_digest != digest:
+            raise MapLoaderException("Compiled map is out of date")
+        if cell_size != BorderIndex.CELL_SIZE:
+            raise MapLoaderException("Compiled map was built with other parameters")
+
+        self._borders_offset = self.HEADER.size
+        self._chunks_offset = self._borders_offset + self._borders_count * self.BORDER.size
+        self._cells_offset = self._chunks_offset + self._chunks_count * self.CHUNK.size
+        self._buckets_offset = self._cells_offset + self._chunks_count * self._chunk_size * self._chunk_size
+        self._entries_offset = self._buckets_offset + self._buckets_count * self.BUCKET.size
+        if len(self._mmap) != self._entries_offset + self._entries_count * 4:
+            raise MapLoaderException(f"Incorrect compiled map file: {filename}")
+
+    @classmethod
+    def open_cached(cls, filename: str, digest: bytes) -> Optional["CompiledLoader"]:
+        try:
+            return cls(filename, digest)
+        except (OSError, ValueError, MapLoaderException):
+            return None
+
+    @classmethod
+    def write(cls, filename: str, map_: Map, digest: bytes = b""):
+        occupancy, index = map_.occupancy, map_.border_index
+        buckets, entries = bytearray(), []
+        for (cell_x, cell_y), bucket in index.buckets.items():
+            buckets += cls.BUCKET.pack(cell_x, cell_y, len(entries), len(bucket))
+            entries.extend(bucket)
+
+        # Пишем во временный файл, чтобы читатель не увидел недописанную карту
+        temp_filename = f"{filename}.{os.getpid()}.tmp"
+        try:
+            with open(temp_filename, "wb") as f:
+                f.write(cls.HEADER.pack(cls.MAGIC, digest, occupancy.dimension, index.cell_size,
+                                        occupancy.chunk_size, occupancy.free_count, len(map_.borders),
+                                        len(occupancy.chunks), len(index.buckets), len(entries)))
+                f.write(b"".join(cls.BORDER.pack(b.corner.x, b.corner.y, b.width, b.height) for b in map_.borders))
+                f.write(b"".join(cls.CHUNK.pack(x, y) for x, y in occupancy.chunks))
+                for chunk in occupancy.chunks.values():
+                    f.write(chunk)
+                f.write(buckets)
+                f.write(struct.pack(f"<{len(entries)}I", *entries))
+            os.replace(temp_filename, filename)
+        finally:
+            with suppress(FileNotFoundError):
+                os.remove(temp_filename)
+
+    def _deserialize_file(self) -> List[Rect]:
+        data = memoryview(self._mmap)[self._borders_offset:self._chunks_offset]
+        return [Rect(Point(x, y), width, height) for x, y, width, height in self.BORDER.iter_unpack(data)]
+
+    def load(self, seed: int = None) -> Map:
+        borders = self._deserialize_file()
+        # Куски растра - срезы отображения, без копирования
+        cells, size = memoryview(self._mmap), self._chunk_size * self._chunk_size
+        coords = self.CHUNK.iter_unpack(cells[self._chunks_offset:self._cells_offset])
+        chunks = {coord: cells[self._cells_offset + i * size:self._cells_offset + (i + 1) * size]
+                  for i, coord in enumerate(coords)}
+        occupancy = OccupancyGrid.from_chunks(chunks, self._dimension, self._chunk_size, self._free_count)
+
+        entries = struct.unpack_from(f"<{self._entries_count}I", self._mmap, self._entries_offset)
+        buckets = {}
+        data = memoryview(self._mmap)[self._buckets_offset:self._entries_offset]
+        for cell_x, cell_y, start, count in self.BUCKET.iter_unpack(data):
+            buckets[(cell_x, cell_y)] = list(entries[start:start + count])
+        border_index = BorderIndex.from_buckets(borders, buckets, BorderIndex.CELL_SIZE)
+        return Map(borders, seed=seed, occupancy=occupancy, border_index=border_index)
+
+
+class _JsonStreamReader:
+    # Минимальный потоковый разбор JSON поверх json.JSONDecoder.raw_decode
+    _decoder = json.JSONDecoder()
+
+    def __init__(self, file: TextIO, chunk_size: int):
+        self._file = file
+        self._chunk_size = chunk_size
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self) -> bool:
+        if self._eof:
+            return False
+        chunk = self._file.read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def _skip_whitespace(self):
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in " \t\r\n":
+                self._pos += 1
+            if self._pos < len(self._buffer) or not self._fill():
+                return
+
+    def accept(self, char: str) -> bool:
+        self._skip_whitespace()
+        if self._buffer.startswith(char, self._pos):
+            self._pos += 1
+            return True
+        return False
+
+    def expect(self, char: str):
+        if not self.accept(char):
+            raise MapLoaderException(f"Incorrect map file: expected '{char}'")
+
+    def expect_end(self):
+        self._skip_whitespace()
+        if self._pos < len(self._buffer):
+            raise MapLoaderException("Incorrect map file: extra data after the map")
+
+    def value(self) -> Any:
+        self._skip_whitespace()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError as e:
+                if self._fill():
+                    continue
+                raise MapLoaderException(f"Incorrect map file: {e.msg}")
+            # Число на краю буфера могло быть обрезано: дочитываем и разбираем заново
+            if end == len(self._buffer) and self._fill():
+                continue
+            self._pos = end
+            return value
+
+    def array_items(self) -> Iterator[Any]:
+        self.expect("[")
+        if self.accept("]"):
+            return
+        while True:
+            yield self.value()
+            if self.accept("]"):
+                return
+            self.expect(",")
+
+
+def dimension_from_record(value: Any) -> int:
+    if not isinstance(value, int) or isinstance(value, bool) or value <= 0:
+        raise MapLoaderException("Incorrect map file: dimension must be a positive integer")
+    return value
+
+
+def border_from_record(record: dict, number: int) -> Rect:
+    try:
+        point = record["point"]
+        values = point["x"], point["y"], record["width"], record["height"]
+    except KeyError as e:
+        raise MapLoaderException(f"Incorrect map file: missing key {e}")
+    except TypeError:
+        raise MapLoaderException(f"Incorrect map file: border {number} is not an object")
+    if not all(isinstance(value, int) and not isinstance(value, bool) for value in values):
+        raise MapLoaderException(f"Incorrect map file: border {number} has non-integer coordinates")
+    try:
+        return Rect(corner=Point(values[0], values[1]), width=values[2], height=values[3])
+    except ValueError as e:
+        raise MapLoaderException(f"Incorrect map file: border {number}: {e}")
@@ -0,0 +1,70 @@
+import threading
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from .loaders import AbstractLoader, JsonLoader
+from .map_ import Map
+
+
+@dataclass(frozen=True)
+class LoadProgress:
+    stage: str
+    fraction: float  # От 0 до 1
+
+
+class MapLoadWorker(threading.Thread):
+    # Загружает и готовит карту в отдельном потоке: разбор файла, растр, индекс границ,
+    # расстановка объектов и поле расстояний. Как и SimulationWorker, наружу отдаёт
+    # неизменяемый LoadProgress, который подменяется целиком.
+    # Доля каждого этапа в общей шкале прогресса
+    STAGES = (("Чтение карты", 0.4), ("Подготовка карты", 0.4), ("Поле расстояний", 0.2))
+    _progress: LoadProgress
+    _map: Optional[Map] = None
+    _error: Optional[BaseException] = None
+
+    def __init__(self, filename: str, seed: int = None,
+                 loader_factory: Callable[[str], AbstractLoader] = JsonLoader):
+        super().__init__(daemon=True, name="map-loader")
+        self._filename = filename
+        self._seed = seed
+        self._loader_factory = loader_factory
+        self._done = threading.Event()
+        self._progress = LoadProgress(self.STAGES[0][0], 0.0)
+
+    def _stage(self, index: int):
+        self._progress = LoadProgress(self.STAGES[index][0], sum(weight for _, weight in self.STAGES[:index]))
+
+    def run(self):
+        try:
+            self._stage(0)
+            loader = self._loader_factory(self._filename)
+            self._stage(1)
+            map_ = loader.load(self._seed)
+            self._stage(2)
+            # Плитки поля под объектами иначе строились бы при первом выталкивании, уже во время игры
+            map_.distance_field.warm(obj.pos.to_tuple() for obj in map_.targets_view)
+            self._map = map_
+            self._progress = LoadProgress("Готово", 1.0)
+        except Exception as e:
+            self._error = e
+        finally:
+            self._done.set()
+
+    def wait(self, timeout: float = None) -> bool:
+        return self._done.wait(timeout)
+
+    def result(self) -> Map:
+        # Готовая карта; исключение загрузки пробрасывается вызывающему
+        if not self._done.is_set():
+            raise RuntimeError("Map is not loaded yet")
+        if self._error is not None:
+            raise self._error
+        return self._map
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    @property
+    def progress(self) -> LoadProgress:
+        return self._progress
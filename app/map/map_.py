@@ -1,12 +1,17 @@
+import math
 import random
 
 from contextlib import suppress
-from copy import deepcopy
 from abc import ABC, abstractmethod
 from itertools import product
-from typing import List, Tuple, Union, Set
+from typing import List, Tuple, Union, Set, Iterable, Iterator, Dict, Optional, Sequence, TYPE_CHECKING
 from dataclasses import dataclass
 from enum import Enum
+from fractions import Fraction
+
+if TYPE_CHECKING:
+    # distance_field импортирует этот модуль и NumPy: во время работы он подключается лениво
+    from .distance_field import DistanceField
 
 DIMENSION = 1000
 
@@ -22,7 +27,8 @@ class SideStep(Enum):
     LEFT = (-1, 0)
 
 
-@dataclass
+# slots=True: без __dict__ у каждого экземпляра, объектов на карте тысячи
+@dataclass(slots=True)
 class Point:
     x: int
     y: int
@@ -32,12 +38,14 @@ class Point:
 
 
 class AbstractContainsMixin(ABC):
+    __slots__ = ()
+
     @abstractmethod
     def contains(self, point: Point) -> bool:
         raise NotImplementedError
 
 
-@dataclass
+@dataclass(slots=True)
 class Rect(AbstractContainsMixin):
     corner: Point  # Левый верхний угол
     width: int
@@ -52,18 +60,48 @@ class Rect(AbstractContainsMixin):
         return x <= point.x < x + self.width and y <= point.y < y + self.height
 
     def collide(self, circle: "Circle"):
-        circle_rect = Rect(Point(circle.pos.x - circle.radius,
-                                 circle.pos.y - circle.radius),
-                           width=circle.radius * 2,
-                           height=circle.radius * 2)
-
-        return self.corner.x < circle_rect.corner.x + circle_rect.width and \
-            self.corner.x + self.width > circle_rect.corner.x and \
-            self.corner.y < circle_rect.corner.y + circle_rect.height and \
-            self.corner.y + self.height > circle_rect.corner.y
-
-
-@dataclass
+        return self.collide_circle(circle.pos.x, circle.pos.y, circle.radius)
+
+    def collide_circle(self, x: int, y: int, radius: int) -> bool:
+        # Круг задевает прямоугольник, если в круге лежит центр хотя бы одной его клетки.
+        # Считается в удвоенных координатах, где центры клеток целые
+        nearest_x = min(max(2 * x, 2 * self.corner.x + 1), 2 * (self.corner.x + self.width) - 1)
+        nearest_y = min(max(2 * y, 2 * self.corner.y + 1), 2 * (self.corner.y + self.height) - 1)
+        return (nearest_x - 2 * x) ** 2 + (nearest_y - 2 * y) ** 2 < 4 * radius * radius
+
+    def collide_square(self, x: int, y: int, radius: int) -> bool:
+        # Пересечение с квадратом [x - radius, x + radius) x [y - radius, y + radius)
+        corner = self.corner
+        return corner.x < x + radius and corner.x + self.width > x - radius and \
+            corner.y < y + radius and corner.y + self.height > y - radius
+
+    def intersect_segment(self, start: Point, end: Point) -> Optional[Fraction]:
+        # Наименьший t из [0, 1], при котором точка start + (end - start) * t лежит
+        # в прямоугольнике (в том же смысле, что и contains), либо None.
+        # Считается в дробях, чтобы касания краёв определялись точно.
+        lower, lower_closed, upper, upper_closed = Fraction(0), True, Fraction(1), True
+        for origin, delta, low, high in ((start.x, end.x - start.x, self.corner.x, self.corner.x + self.width),
+                                         (start.y, end.y - start.y, self.corner.y, self.corner.y + self.height)):
+            if delta == 0:
+                if not low <= origin < high:
+                    return None
+                continue
+            if delta > 0:
+                enter, enter_closed = Fraction(low - origin, delta), True
+                leave, leave_closed = Fraction(high - origin, delta), False
+            else:
+                enter, enter_closed = Fraction(high - origin, delta), False
+                leave, leave_closed = Fraction(low - origin, delta), True
+            if enter > lower or (enter == lower and not enter_closed):
+                lower, lower_closed = enter, enter_closed
+            if leave < upper or (leave == upper and not leave_closed):
+                upper, upper_closed = leave, leave_closed
+        if lower < upper or (lower == upper and lower_closed and upper_closed):
+            return lower
+        return None
+
+
+@dataclass(slots=True)
 class Circle(AbstractContainsMixin):
     pos: Point
     is_target: bool
@@ -81,94 +119,683 @@ class Circle(AbstractContainsMixin):
         dist = ((cx - x) ** 2 + (cy - y) ** 2) ** (1 / 2)
         return dist <= self.radius
 
+    def bounding_rect(self, center: Tuple[int, int] = None) -> Rect:
+        x, y = center or self.pos.to_tuple()
+        return Rect(Point(x - self.radius, y - self.radius), width=self.radius * 2, height=self.radius * 2)
+
+
+# Прежний и новый ограничивающие прямоугольники каждого сдвинувшегося за тик объекта
+MovedBoxes = List[Tuple[Rect, Rect]]
+
+
+class OccupancyGrid:
+    # Растровая карта занятости мира dimension x dimension: один байт на клетку,
+    # ненулевой байт означает, что клетка покрыта хотя бы одной границей.
+    # Растр разбит на квадратные куски chunk_size x chunk_size, и хранятся только куски,
+    # которых касаются границы: память растёт с числом границ, а не с площадью мира.
+    CHUNK_SIZE = 32
+    _chunks: Dict[Tuple[int, int], Union[bytearray, memoryview]]
+    _dimension: int
+    _chunk_size: int
+    _free_count: Optional[int] = None
+
+    def __init__(self, rects: Iterable[Rect], dimension: int = DIMENSION, chunk_size: int = CHUNK_SIZE):
+        self._dimension = dimension
+        self._chunk_size = chunk_size
+        self._chunks = {}
+        for rect in rects:
+            self.fill(rect)
+
+    @classmethod
+    def from_chunks(cls, chunks: Dict[Tuple[int, int], Union[bytearray, memoryview]], dimension: int,
+                    chunk_size: int, free_count: int) -> "OccupancyGrid":
+        # Готовые куски, например отображённые в память из скомпилированной карты
+        grid = cls.__new__(cls)
+        grid._dimension = dimension
+        grid._chunk_size = chunk_size
+        grid._chunks = chunks
+        grid._free_count = free_count
+        return grid
+
+    def fill(self, rect: Rect):
+        left, top = max(rect.corner.x, 0), max(rect.corner.y, 0)
+        right = min(rect.corner.x + rect.width, self._dimension)
+        bottom = min(rect.corner.y + rect.height, self._dimension)
+        if left >= right or top >= bottom:
+            return
+        size = self._chunk_size
+        for cx, cy in product(range(left // size, (right - 1) // size + 1),
+                              range(top // size, (bottom - 1) // size + 1)):
+            chunk = self._chunks.get((cx, cy))
+            if chunk is None:
+                chunk = self._chunks[cx, cy] = bytearray(size * size)
+            # Часть прямоугольника внутри куска, в координатах куска
+            x0, x1 = max(left - cx * size, 0), min(right - cx * size, size)
+            row = b"\x01" * (x1 - x0)
+            for y in range(max(top - cy * size, 0), min(bottom - cy * size, size)):
+                chunk[y * size + x0:y * size + x1] = row
+        self._free_count = None
+
+    def sample_free(self, count: int, rng: random.Random) -> List[Point]:
+        # Случайные различные свободные клетки без перебора всего мира
+        size = self._dimension * self._dimension
+        free_count = self.free_count
+        if free_count < count:
+            raise MapException("Not enough free space for objects")
+        if free_count * 100 >= size:
+            indexes, seen = [], set()
+            while len(indexes) < count:
+                index = rng.randrange(size)
+                if not self._contains_index(index) and index not in seen:
+                    seen.add(index)
+                    indexes.append(index)
+        else:
+            # Карта почти целиком занята: отбор вслепую стал бы слишком долгим
+            indexes = rng.sample([i for i in range(size) if not self._contains_index(i)], count)
+        return [Point(index % self._dimension, index // self._dimension) for index in indexes]
+
+    def _contains_index(self, index: int) -> bool:
+        return self._contains(index % self._dimension, index // self._dimension)
+
+    def _contains(self, x: int, y: int) -> bool:
+        size = self._chunk_size
+        chunk = self._chunks.get((x // size, y // size))
+        return chunk is not None and chunk[y % size * size + x % size] != 0
+
+    def in_bounds(self, point: Point) -> bool:
+        return 0 <= point.x < self._dimension and 0 <= point.y < self._dimension
+
+    def contains(self, point: Point) -> bool:
+        return self._contains(point.x, point.y)
+
+    @property
+    def dimension(self) -> int:
+        return self._dimension
+
+    @property
+    def chunk_size(self) -> int:
+        return self._chunk_size
+
+    @property
+    def chunks(self) -> Dict[Tuple[int, int], Union[bytearray, memoryview]]:
+        return self._chunks
+
+    @property
+    def free_count(self) -> int:
+        if self._free_count is None:
+            # Клетки кусков за краем мира никогда не заполняются, считаем только занятые
+            occupied = sum(len(chunk) - chunk.count(0) for chunk in self._chunks.values())
+            self._free_count = self._dimension * self._dimension - occupied
+        return self._free_count
+
+
+class BorderIndex:
+    # Равномерная сетка корзин: для каждой ячейки хранятся номера границ,
+    # которые её пересекают, в порядке следования границ на карте
+    CELL_SIZE = 64
+    _rects: List[Rect]
+    _cells: Dict[Tuple[int, int], List[int]]
+    _cell_size: int
+
+    def __init__(self, rects: List[Rect], cell_size: int = CELL_SIZE):
+        self._rects = rects
+        self._cell_size = cell_size
+        self._cells = {}
+        for index, rect in enumerate(rects):
+            for cell in self._cells_in(rect.corner.x, rect.corner.y,
+                                       rect.corner.x + rect.width, rect.corner.y + rect.height):
+                self._cells.setdefault(cell, []).append(index)
+
+    @classmethod
+    def from_buckets(cls, rects: List[Rect], buckets: Dict[Tuple[int, int], List[int]],
+                     cell_size: int = CELL_SIZE) -> "BorderIndex":
+        index = cls.__new__(cls)
+        index._rects = rects
+        index._cells = buckets
+        index._cell_size = cell_size
+        return index
+
+    def _cells_in(self, left: int, top: int, right: int, bottom: int) -> Iterator[Tuple[int, int]]:
+        # Ячейки, покрывающие полуоткрытую область [left, right) x [top, bottom)
+        size = self._cell_size
+        return product(range(left // size, (right - 1) // size + 1),
+                       range(top // size, (bottom - 1) // size + 1))
+
+    def query(self, left: int, top: int, right: int, bottom: int) -> List[Rect]:
+        # Границы, которые могут пересекать область
+        size = self._cell_size
+        x0, x1 = left // size, (right - 1) // size
+        y0, y1 = top // size, (bottom - 1) // size
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > len(self._cells):
+            # Область больше всей заполненной части индекса (например, отдалённая камера
+            # на большом мире): дешевле пройти по непустым ячейкам
+            buckets = [bucket for (x, y), bucket in self._cells.items() if x0 <= x <= x1 and y0 <= y <= y1]
+        else:
+            buckets = [bucket for cell in self._cells_in(left, top, right, bottom)
+                       if (bucket := self._cells.get(cell))]
+        if len(buckets) == 1:
+            return [self._rects[index] for index in buckets[0]]
+        return [self._rects[index] for index in sorted(set().union(*buckets))]
+
+    def walk_segment(self, start: Point, end: Point) -> Iterator[Tuple[List[int], int, int]]:
+        # Непустые ячейки, через которые проходит отрезок start -> end, в порядке прохода (DDA).
+        # Для каждой - номера её границ и t = num / den, при котором отрезок её покидает:
+        # все точки с меньшим t лежат в уже отданных ячейках. У последней ячейки t >= 1
+        size, cells = self._cell_size, self._cells
+        x, y = start.x // size, start.y // size
+        dx, dy = end.x - start.x, end.y - start.y
+        step_x, step_y = (1 if dx > 0 else -1), (1 if dy > 0 else -1)
+        # Расстояние вдоль оси до выхода из ячейки: точка на левом или верхнем крае
+        # ещё в ячейке, на правом или нижнем - уже в следующей
+        bx = (x + 1) * size - start.x if dx > 0 else start.x - x * size
+        by = (y + 1) * size - start.y if dy > 0 else start.y - y * size
+        dx, dy = abs(dx), abs(dy)
+        if not dx and not dy:
+            bucket = cells.get((x, y))
+            if bucket:
+                yield bucket, 1, 1
+            return
+        while True:
+            # Выход через угол: первым делается шаг по оси, идущей в сторону роста,
+            # потому что сама точка угла лежит уже в ячейке за этим краем
+            along_x = dx and (not dy or bx * dy < by * dx or (bx * dy == by * dx and (step_x > 0 or step_y < 0)))
+            num, den, step = (bx, dx, step_x) if along_x else (by, dy, step_y)
+            bucket = cells.get((x, y))
+            if bucket:
+                yield bucket, num, den
+            # Конец отрезка на правом или нижнем крае лежит уже в следующей ячейке
+            if num > den or (num == den and step < 0):
+                return
+            if along_x:
+                x += step_x
+                bx += size
+            else:
+                y += step_y
+                by += size
+
+    def query_path(self, points: Sequence[Point]) -> List[Rect]:
+        # Границы из всех ячеек, через которые проходит ломаная points: один запрос на путь,
+        # дальше каждый его отрезок проверяется только по ним
+        indexes = set()
+        for start, end in zip(points, points[1:]):
+            for bucket, _, _ in self.walk_segment(start, end):
+                indexes.update(bucket)
+        return [self._rects[index] for index in sorted(indexes)]
+
+    @property
+    def rects(self) -> List[Rect]:
+        return self._rects
+
+    @property
+    def buckets(self) -> Dict[Tuple[int, int], List[int]]:
+        return self._cells
+
+    @property
+    def cell_size(self) -> int:
+        return self._cell_size
+
+    def query_point(self, point: Point) -> List[Rect]:
+        return self.query(point.x, point.y, point.x + 1, point.y + 1)
+
+    def query_circle(self, circle: "Circle", margin: int = 0) -> List[Rect]:
+        extent = circle.radius + margin
+        return self.query(circle.pos.x - extent, circle.pos.y - extent,
+                          circle.pos.x + extent, circle.pos.y + extent)
+
+
+class ObjectGrid:
+    # Широкая фаза столкновений объектов: равномерная сетка, ячейка не меньше диаметра
+    # наибольшего объекта, поэтому пересекающиеся круги лежат в одной или соседних ячейках.
+    # Сетка обновляется инкрементально: объект переносится, только если сменил ячейку.
+    # Соседние ячейки, которые просматриваются для каждой ячейки: каждая пара один раз
+    NEIGHBOURS = ((1, 0), (-1, 1), (0, 1), (1, 1))
+    _objects: Tuple[Circle, ...]
+    _cells: Dict[Tuple[int, int], List[int]]
+    _cell_of: List[Tuple[int, int]]
+    _cell_size: int
+
+    def __init__(self, objects: Iterable[Circle], cell_size: int = None):
+        self._objects = tuple(objects)
+        self._cell_size = cell_size or max([obj.radius * 2 for obj in self._objects] + [1])
+        self._cells = {}
+        self._cell_of = []
+        for index, obj in enumerate(self._objects):
+            cell = self._cell(obj)
+            self._cell_of.append(cell)
+            self._cells.setdefault(cell, []).append(index)
+
+    def _cell(self, obj: Circle) -> Tuple[int, int]:
+        return obj.pos.x // self._cell_size, obj.pos.y // self._cell_size
+
+    def update(self):
+        cells, cell_of = self._cells, self._cell_of
+        for index, obj in enumerate(self._objects):
+            cell = self._cell(obj)
+            old = cell_of[index]
+            if cell == old:
+                continue
+            bucket = cells[old]
+            bucket.remove(index)
+            if not bucket:
+                del cells[old]
+            cells.setdefault(cell, []).append(index)
+            cell_of[index] = cell
+
+    def pairs(self) -> Iterator[Tuple[int, int]]:
+        # Пары объектов, которые могут пересекаться
+        cells = self._cells
+        for (cell_x, cell_y), bucket in cells.items():
+            for k, i in enumerate(bucket):
+                for j in bucket[k + 1:]:
+                    yield i, j
+            for dx, dy in self.NEIGHBOURS:
+                other = cells.get((cell_x + dx, cell_y + dy))
+                if other:
+                    for i in bucket:
+                        for j in other:
+                            yield i, j
+
+    def colliding_pairs(self) -> List[Tuple[int, int]]:
+        # Пересекающиеся пары (i < j) в порядке номеров, чтобы отклик не зависел от истории сетки
+        objects = self._objects
+        xs = [obj.pos.x for obj in objects]
+        ys = [obj.pos.y for obj in objects]
+        radii = [obj.radius for obj in objects]
+        colliding = []
+        for i, j in self.pairs():
+            dx, dy, distance = xs[j] - xs[i], ys[j] - ys[i], radii[i] + radii[j]
+            if dx * dx + dy * dy < distance * distance:
+                colliding.append((i, j) if i < j else (j, i))
+        colliding.sort()
+        return colliding
+
+    @property
+    def cell_size(self) -> int:
+        return self._cell_size
+
+
+class AbstractEngine(ABC):
+    # Движок симуляции: продвигает объекты карты на один тик
+    _map: "Map"
+    _object_grid: ObjectGrid
+    push_outs: int = 0  # Сколько раз объекты выталкивались из границ
+    target_push_outs: int = 0  # Из них - цель
+    object_collisions: int = 0  # Сколько раз объекты столкнулись друг с другом
+
+    def __init__(self, map_: "Map"):
+        self._map = map_
+        self._object_grid = ObjectGrid(map_.targets_view)
+
+    @abstractmethod
+    def process(self) -> MovedBoxes:
+        raise NotImplementedError
+
+    def rebuild(self):
+        # Вызывается картой после смены границ
+        pass
+
+    def flush(self):
+        # Переносит внутреннее состояние движка в объекты Circle
+        pass
+
+    def _push_out(self, obj: Circle):
+        # Выталкивание: объект поднимается по полю расстояний до границ, пока его квадрат
+        # (тот же, что у проб движка) задевает границы, а застряв - переносится
+        # в ближайшую свободную точку
+        self.push_outs += 1
+        if obj.is_target:
+            self.target_push_outs += 1
+        self._map.distance_field.push_out(obj, self._map.collide_square)
+
+    def _collide_objects(self) -> List[int]:
+        # Столкновения объектов друг с другом после тика. Массы равны, поэтому при упругом ударе
+        # объекты обмениваются скоростями. Сближение проверяется, чтобы пересёкшиеся пары
+        # не обменивались скоростями каждый тик. Скорость цели задаёт пользователь, поэтому
+        # с целью объекты обмениваются только направлениями. Возвращает номера объектов со сменённой скоростью.
+        if not self._map.OBJECTS_COLLIDE:
+            return []
+        objects = self._map.targets_view
+        grid = self._object_grid
+        grid.update()
+        changed = []
+        for i, j in grid.colliding_pairs():
+            a, b = objects[i], objects[j]
+            dx, dy = b.pos.x - a.pos.x, b.pos.y - a.pos.y
+            vx = b.speed * b.speed_vector.x - a.speed * a.speed_vector.x
+            vy = b.speed * b.speed_vector.y - a.speed * a.speed_vector.y
+            if dx == dy == 0:
+                # Центры совпали: при разных скоростях объекты и так разойдутся,
+                # при одинаковых второй разворачивается, иначе они так и пойдут вместе
+                if vx or vy:
+                    continue
+                self.object_collisions += 1
+                b.speed_vector = Point(-b.speed_vector.x, -b.speed_vector.y)
+                changed.append(j)
+                continue
+            if dx * vx + dy * vy >= 0:
+                continue
+            self.object_collisions += 1
+            if not a.is_target and not b.is_target:
+                a.speed, b.speed = b.speed, a.speed
+            a.speed_vector, b.speed_vector = b.speed_vector, a.speed_vector
+            changed += (i, j)
+        return changed
+
+
+# Неизменяемые множества сторон по битовой маске (бит i - i-я сторона SideStep),
+# чтобы не создавать новое множество на каждом шаге
+SIDE_SETS = tuple(frozenset(side for i, side in enumerate(SideStep) if mask >> i & 1)
+                  for mask in range(1 << len(SideStep)))
+SIDE_PROBES = tuple((1 << i, side.value[0], side.value[1]) for i, side in enumerate(SideStep))
+
+
+class SequentialEngine(AbstractEngine):
+    # Исходный движок: каждый объект по одному шагу за раз
+    def process(self) -> MovedBoxes:
+        moved = []
+        for obj in self._map.targets_view:
+            pos = obj.pos
+            start = pos.to_tuple()
+            for _ in range(obj.speed):
+                self._update_sides(obj)
+                # Сдвигаем на месте, без нового Point на каждый шаг
+                pos.x += obj.speed_vector.x
+                pos.y += obj.speed_vector.y
+            if pos.to_tuple() != start:
+                moved.append((obj.bounding_rect(start), obj.bounding_rect()))
+        self._resolve_object_collisions()
+        return moved
+
+    def _update_sides(self, obj: Circle):
+        # Проверка соседних сторон перед шагом: если набор занятых сторон сменился,
+        # объект поворачивает в свободную сторону, а если свободных нет - выталкивается
+        map_ = self._map
+        pos = obj.pos
+        mask = 0
+        for bit, dx, dy in SIDE_PROBES:
+            if map_.collide_square(pos.x + dx, pos.y + dy, obj.radius):
+                mask |= bit
+        bounding_sides = SIDE_SETS[mask]
+
+        if obj.bounding_sides != bounding_sides:
+            try:
+                # Фиксированный порядок сторон, чтобы выбор зависел только от seed
+                side_to_move = map_.random.choice([side for side in SideStep
+                                                   if side not in bounding_sides])
+                obj.speed_vector = Point(*side_to_move.value)
+            except IndexError:
+                self._push_out(obj)
+
+        obj.bounding_sides = bounding_sides
+
+    def _resolve_object_collisions(self):
+        for index in self._collide_objects():
+            obj = self._map.targets_view[index]
+            # Новое направление может упираться в границу: забываем соседние стороны,
+            # и на следующем шаге движок выберет свободную
+            if any(side.value == obj.speed_vector.to_tuple() for side in obj.bounding_sides):
+                obj.bounding_sides = SIDE_SETS[0]
+
+
+class EventEngine(SequentialEngine):
+    # Событийный движок: те же траектории, что у SequentialEngine, но объект сразу проходит
+    # весь отрезок до ближайшего события - шага, на котором хотя бы одна из четырёх проб
+    # начинает или перестаёт задевать границу. Между событиями набор занятых сторон
+    # не меняется, поэтому пошаговый движок там только сдвигал бы объект.
+    # Стоимость тика зависит от числа событий и границ рядом, а не от скорости.
+    def process(self) -> MovedBoxes:
+        moved = []
+        for obj in self._map.targets_view:
+            pos = obj.pos
+            start = pos.to_tuple()
+            remaining = obj.speed
+            while remaining > 0:
+                before = pos.to_tuple()
+                self._update_sides(obj)
+                # После выталкивания стороны объекта посчитаны для прежнего места,
+                # поэтому следующий шаг снова проверяется пробами
+                run = self._free_run(obj, remaining) if pos.to_tuple() == before else 1
+                pos.x += obj.speed_vector.x * run
+                pos.y += obj.speed_vector.y * run
+                remaining -= run
+            if pos.to_tuple() != start:
+                moved.append((obj.bounding_rect(start), obj.bounding_rect()))
+        self._resolve_object_collisions()
+        return moved
+
+    def _free_run(self, obj: Circle, limit: int) -> int:
+        # Через сколько шагов вдоль speed_vector (не больше limit) случится ближайшее событие
+        vx, vy = obj.speed_vector.x, obj.speed_vector.y
+        if limit == 1 or not vx and not vy:
+            return limit
+        x, y, radius = obj.pos.x, obj.pos.y, obj.radius
+        # Область, которую заметают пробы за limit шагов: пробы выступают на клетку во все стороны
+        left, right = x - radius - 1 + min(vx * limit, 0), x + radius + 1 + max(vx * limit, 0)
+        top, bottom = y - radius - 1 + min(vy * limit, 0), y + radius + 1 + max(vy * limit, 0)
+        run = limit
+        for border in self._map.border_index.query(left, top, right, bottom):
+            border_left, border_top = border.corner.x, border.corner.y
+            border_right, border_bottom = border_left + border.width, border_top + border.height
+            for _, dx, dy in SIDE_PROBES:
+                probe_x, probe_y = x + dx, y + dy
+                # Проекция на ось движения, направленную по скорости: u - проба, [low, high) - граница
+                if vx:
+                    if not (border_top < probe_y + radius and border_bottom > probe_y - radius):
+                        continue
+                    u, low, high = (probe_x, border_left, border_right) if vx > 0 else \
+                        (-probe_x, -border_right, -border_left)
+                else:
+                    if not (border_left < probe_x + radius and border_right > probe_x - radius):
+                        continue
+                    u, low, high = (probe_y, border_top, border_bottom) if vy > 0 else \
+                        (-probe_y, -border_bottom, -border_top)
+                # Проба задевает границу на шагах t из [first, last]
+                first, last = low - u - radius + 1, high - u + radius - 1
+                if first >= 1:
+                    run = min(run, first)
+                elif last >= 0:
+                    run = min(run, last + 1)
+        return run
+
 
 class Map:
     OBJECTS_COUNT = 15
     OBJECT_MAX_SPEED = 10
-    _borders: List[Rect]
-    _targets: List[Circle]
+    # Сталкиваются ли объекты друг с другом, а не только с границами
+    OBJECTS_COLLIDE = True
+    _random: random.Random
+    _borders: Tuple[Rect, ...]
+    _occupancy: OccupancyGrid
+    _border_index: BorderIndex
+    _dimension: int
+    _targets: Tuple[Circle, ...]
+    _max_radius: int
     _target: Circle
-
-    def __init__(self, borders: List[Rect], targets: List[Circle] = None):
-        self._borders = borders
-        self._targets = targets or self._generate_targets()
+    _engine: AbstractEngine = None
+    _distance_field: "DistanceField" = None
+
+    def __init__(self, borders: List[Rect], targets: List[Circle] = None, seed: int = None,
+                 occupancy: OccupancyGrid = None, border_index: BorderIndex = None, dimension: int = None):
+        self._random = random.Random(seed)
+        # Сторона квадратного мира; у готового растра она своя
+        self._dimension = dimension or (occupancy.dimension if occupancy else DIMENSION)
+        if self._dimension <= 0:
+            raise MapException("Map dimension must be positive")
+        # Растр и индекс можно передать готовыми, например из скомпилированной карты
+        self._set_borders(borders, occupancy, border_index)
+        self._targets = tuple(targets or self._generate_targets())
         try:
             self._target = list(filter(lambda x: x.is_target, self._targets))[0]
         except IndexError:
             raise MapException("Target does not exist")
         self._validate_objects(self._targets)
+        self._max_radius = max(obj.radius for obj in self._targets)
+        self._engine = SequentialEngine(self)
 
     def _generate_targets(self) -> List[Circle]:
         objects = []
-        free_positions = set(product(list(range(DIMENSION)), repeat=2))
-        borders_positions = set()
-        for obj in self._borders:
-            for row_index in range(obj.corner.y, obj.corner.y + obj.height):
-                for column_index in range(obj.corner.x, obj.corner.x + obj.width):
-                    borders_positions.add((column_index, row_index))
-
-        free_positions -= borders_positions
-        for i, pos in enumerate(random.sample(free_positions, self.OBJECTS_COUNT)):
-            speed = random.randint(1, self.OBJECT_MAX_SPEED)
-            x_speed = random.choice((True, False))
-            coeff = random.choice((1, -1))
+        for i, pos in enumerate(self._occupancy.sample_free(self.OBJECTS_COUNT, self._random)):
+            speed = self._random.randint(1, self.OBJECT_MAX_SPEED)
+            x_speed = self._random.choice((True, False))
+            coeff = self._random.choice((1, -1))
             speed_vector = Point(x=int(x_speed) * coeff, y=int(not x_speed) * coeff)
-            objects.append(Circle(Point(*pos), i == 0, speed_vector=speed_vector, speed=speed))
+            objects.append(Circle(pos, i == 0, speed_vector=speed_vector, speed=speed))
         return objects
 
     def _validate_objects(self, objects: List[Circle]):
-        for rect in self._borders:
-            if any(rect.contains(obj.pos) for obj in objects):
+        for obj in objects:
+            if any(rect.contains(obj.pos) for rect in self._border_index.query_point(obj.pos)):
                 raise MapException("Obj in border")
 
     def collide_with_borders(self, obj: Union[Point, Circle]) -> bool:
         if isinstance(obj, Point):
-            return any(border.contains(obj) for border in self._borders)
+            if self._occupancy.in_bounds(obj):
+                return self._occupancy.contains(obj)
+            # За пределами мира растра нет, проверяем ближайшие границы напрямую
+            return any(border.contains(obj) for border in self._border_index.query_point(obj))
         else:
-            return any(border.collide(obj) for border in self._borders)
+            return self.collide_circle(obj.pos.x, obj.pos.y, obj.radius)
+
+    def collide_circle(self, x: int, y: int, radius: int) -> bool:
+        # Точная проверка круга: один взгляд в поле расстояний, если радиус в его пределах
+        field = self.distance_field
+        if radius <= field.max_distance:
+            return field.collide_circle(x, y, radius)
+        return any(border.collide_circle(x, y, radius)
+                   for border in self._border_index.query(x - radius, y - radius, x + radius, y + radius))
+
+    def collide_square(self, x: int, y: int, radius: int) -> bool:
+        # То же, что collide_with_borders для круга с центром (x, y), но без создания объектов
+        return any(border.collide_square(x, y, radius)
+                   for border in self._border_index.query(x - radius, y - radius, x + radius, y + radius))
+
+    def sweep_segment(self, start: Point, end: Point, borders: Sequence[Rect] = None) -> Optional[Point]:
+        # Проход по отрезку start -> end: None, если путь свободен, иначе последняя
+        # свободная точка перед первым касанием границы. Начальная точка считается свободной.
+        # borders - уже выбранные кандидаты, например BorderIndex.query_path для пути за кадр
+        hit = self._walk_hit(start, end) if borders is None else self._candidates_hit(start, end, borders)
+        if hit is None:
+            return None
+
+        dx, dy = end.x - start.x, end.y - start.y
+        if dx == dy == 0:
+            # Отрезок из одной точки, лежащей в границе: отступать некуда
+            return start
+        # Отступаем на одну клетку вдоль отрезка от точки касания
+        t = max(hit - Fraction(1, max(abs(dx), abs(dy))), Fraction(0))
+        point = Point(start.x + math.floor(dx * t), start.y + math.floor(dy * t))
+        return start if self.collide_with_borders(point) else point
+
+    def _walk_hit(self, start: Point, end: Point) -> Optional[Fraction]:
+        # Ячейки индекса обходятся вдоль отрезка: как только касание найдено не дальше выхода
+        # из текущей ячейки, остальные границы задеть отрезок раньше уже не могут.
+        # Поэтому цена прохода зависит от пути до первого касания, а не от площади отрезка
+        hit, seen, rects = None, set(), self._border_index.rects
+        for bucket, num, den in self._border_index.walk_segment(start, end):
+            for index in bucket:
+                if index in seen:
+                    continue
+                seen.add(index)
+                entry = rects[index].intersect_segment(start, end)
+                if entry is not None and (hit is None or entry < hit):
+                    hit = entry
+            if hit is not None and hit.numerator * den <= num * hit.denominator:
+                break
+        return hit
+
+    @staticmethod
+    def _candidates_hit(start: Point, end: Point, borders: Sequence[Rect]) -> Optional[Fraction]:
+        # Точная проверка в дробях - только для границ, прошедших грубые проверки в целых:
+        # пересечение с рамкой отрезка и углы по разные стороны от его прямой
+        left, right = min(start.x, end.x), max(start.x, end.x)
+        top, bottom = min(start.y, end.y), max(start.y, end.y)
+        dx, dy = end.x - start.x, end.y - start.y
+        hit = None
+        for border in borders:
+            x0, y0 = border.corner.x, border.corner.y
+            x1, y1 = x0 + border.width, y0 + border.height
+            if x0 > right or x1 <= left or y0 > bottom or y1 <= top:
+                continue
+            sides = [dx * (y - start.y) - dy * (x - start.x) for x, y in ((x0, y0), (x1, y0), (x0, y1), (x1, y1))]
+            if min(sides) > 0 or max(sides) < 0:
+                continue
+            entry = border.intersect_segment(start, end)
+            if entry is not None and (hit is None or entry < hit):
+                hit = entry
+        return hit
 
     def collide_with_target(self, pos: Point) -> bool:
         return self._target.contains(pos)
 
-    def process(self):
-        for obj in self._targets:
-            for _ in range(obj.speed):
-                bounding_sides = set()
-                next_circle = deepcopy(obj)
-                for side in (SideStep.TOP, SideStep.RIGHT, SideStep.BOTTOM, SideStep.LEFT):
-                    next_x, next_y = obj.pos.x + side.value[0], obj.pos.y + side.value[1]
-                    next_circle.pos = Point(next_x, next_y)
-                    if self.collide_with_borders(next_circle):
-                        bounding_sides.add(side)
-
-                if obj.bounding_sides != bounding_sides:
-                    try:
-                        side_to_move = random.choice(list({SideStep.BOTTOM, SideStep.TOP,
-                                                           SideStep.LEFT, SideStep.RIGHT} - bounding_sides))
-                        obj.speed_vector = Point(*side_to_move.value)
-                    except IndexError:
-                        # Выталкивание
-                        for border in filter(lambda b: b.collide(obj), self._borders):
-                            for width in (0, border.width):
-                                x_step = abs(border.corner.x + width - obj.pos.x)
-                                x_step = 0 if x_step > obj.radius else x_step
-                                obj.pos.x += x_step * (-1 if not width else 1)
-                            for height in (0, border.height):
-                                y_step = abs(border.corner.y + height - obj.pos.y)
-                                y_step = 0 if y_step > obj.radius else y_step
-                                obj.pos.y += y_step * (-1 if not height else 1)
-
-                obj.bounding_sides = bounding_sides
-                speed_x, speed_y = obj.speed_vector.to_tuple()
-                obj.pos = Point(obj.pos.x + speed_x, obj.pos.y + speed_y)
+    def process(self) -> MovedBoxes:
+        return self._engine.process()
 
     @property
     def borders(self) -> List[Rect]:
-        return self._borders.copy()
+        return list(self._borders)
+
+    @borders.setter
+    def borders(self, borders: List[Rect]):
+        self._set_borders(borders)
+
+    def _set_borders(self, borders: List[Rect], occupancy: OccupancyGrid = None, border_index: BorderIndex = None):
+        self._borders = tuple(borders)
+        self._occupancy = occupancy or OccupancyGrid(self._borders, self._dimension)
+        self._border_index = border_index or BorderIndex(self._borders)
+        self._distance_field = None
+        if self._engine is not None:
+            self._engine.rebuild()
+
+    @property
+    def borders_view(self) -> Tuple[Rect, ...]:
+        # Без копирования списка, для горячих путей
+        return self._borders
+
+    @property
+    def occupancy(self) -> OccupancyGrid:
+        return self._occupancy
+
+    @property
+    def border_index(self) -> BorderIndex:
+        return self._border_index
+
+    @property
+    def distance_field(self) -> "DistanceField":
+        # Строится при первом обращении: нужен NumPy, и большинству тиков поле не требуется
+        if self._distance_field is None:
+            from .distance_field import DistanceField
+            self._distance_field = DistanceField(self._border_index)
+        return self._distance_field
+
+    @property
+    def dimension(self) -> int:
+        return self._dimension
+
+    @property
+    def max_radius(self) -> int:
+        return self._max_radius
+
+    @property
+    def engine(self) -> AbstractEngine:
+        return self._engine
+
+    @engine.setter
+    def engine(self, engine: AbstractEngine):
+        self._engine.flush()
+        self._engine = engine
+
+    @property
+    def random(self) -> random.Random:
+        return self._random
 
     @property
     def targets(self) -> List[Circle]:
-        return self._targets.copy()
+        return list(self._targets)
+
+    @property
+    def targets_view(self) -> Tuple[Circle, ...]:
+        # Без копирования списка, для горячих путей
+        return self._targets
 
     @property
     def target(self) -> Circle:
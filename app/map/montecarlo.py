@@ -0,0 +1,154 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, asdict
+from typing import Iterator, List, Sequence, Dict
+
+from .loaders import JsonLoader
+from .map_ import Map
+from .run import make_engine, ENGINES
+
+
+@dataclass(frozen=True)
+class RunTask:
+    map_file: str
+    run: int
+    seed: int
+    ticks: int
+    objects: int
+    engine: str
+
+
+@dataclass(frozen=True)
+class RunResult:
+    map_file: str
+    run: int
+    seed: int
+    ticks: int
+    distance: int  # Путь всех объектов за прогон (сумма сдвигов по осям)
+    target_distance: int
+    push_outs: int
+    target_push_outs: int
+    trapped: bool  # Цель хотя бы раз оказалась зажата со всех сторон
+    elapsed: float
+
+
+@dataclass
+class Aggregate:
+    # Накопленная статистика по одной карте; обновляется по мере поступления прогонов
+    runs: int = 0
+    trapped: int = 0
+    distance: int = 0
+    target_distance: int = 0
+    push_outs: int = 0
+    ticks: int = 0
+    objects: int = 0
+    elapsed: float = 0
+
+    def add(self, result: RunResult, objects: int):
+        self.runs += 1
+        self.trapped += result.trapped
+        self.distance += result.distance
+        self.target_distance += result.target_distance
+        self.push_outs += result.push_outs
+        self.ticks += result.ticks
+        self.objects += objects
+        self.elapsed += result.elapsed
+
+    def summary(self) -> dict:
+        return {
+            "runs": self.runs,
+            "trapped_rate": self.trapped / self.runs if self.runs else 0,
+            "mean_distance_per_object": self.distance / self.objects if self.objects else 0,
+            "mean_target_distance": self.target_distance / self.runs if self.runs else 0,
+            "push_outs_per_1000_ticks": 1000 * self.push_outs / self.ticks if self.ticks else 0,
+        }
+
+
+def map_digest(map_file: str) -> str:
+    # Карта в seed определяется содержимым: разные карты с одним именем файла
+    # не получают одинаковых seed, а перенос карты в другой каталог их не меняет
+    with open(map_file, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def derive_seed(base_seed: int, content_digest: str, run: int) -> int:
+    # Детерминированный seed прогона: не зависит ни от порядка выполнения, ни от числа процессов
+    digest = hashlib.sha256(f"{base_seed}:{content_digest}:{run}".encode()).digest()
+    return int.from_bytes(digest[:8], "little")
+
+
+def run_one(task: RunTask) -> RunResult:
+    Map.OBJECTS_COUNT = task.objects
+    map_ = JsonLoader(task.map_file).load(seed=task.seed)
+    map_.engine = make_engine(map_, task.engine)
+    target = map_.target
+
+    distance = target_distance = 0
+    start = time.perf_counter()
+    for _ in range(task.ticks):
+        target_x, target_y = target.pos.to_tuple()
+        for previous, current in map_.process():
+            distance += abs(current.corner.x - previous.corner.x) + abs(current.corner.y - previous.corner.y)
+        target_distance += abs(target.pos.x - target_x) + abs(target.pos.y - target_y)
+    elapsed = time.perf_counter() - start
+
+    engine = map_.engine
+    return RunResult(map_file=task.map_file, run=task.run, seed=task.seed, ticks=task.ticks,
+                     distance=distance, target_distance=target_distance,
+                     push_outs=engine.push_outs, target_push_outs=engine.target_push_outs,
+                     trapped=engine.target_push_outs > 0, elapsed=elapsed)
+
+
+def make_tasks(map_files: Sequence[str], runs: int, ticks: int, base_seed: int = 0,
+               objects: int = Map.OBJECTS_COUNT, engine: str = ENGINES[0]) -> List[RunTask]:
+    digests = {map_file: map_digest(map_file) for map_file in map_files}
+    return [RunTask(map_file, run, derive_seed(base_seed, digests[map_file], run), ticks, objects, engine)
+            for map_file in map_files for run in range(runs)]
+
+
+def run_batch(tasks: Sequence[RunTask], workers: int = None) -> Iterator[RunResult]:
+    # Результаты отдаются по мере готовности, в порядке задач
+    for map_file in {task.map_file for task in tasks}:
+        # Заранее строим скомпилированные карты, чтобы процессы не компилировали их наперегонки
+        JsonLoader(map_file).load(seed=0)
+    workers = workers or os.cpu_count()
+    chunk_size = max(1, len(tasks) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(run_one, tasks, chunksize=chunk_size)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.map.montecarlo",
+                                     description="Run many independent headless simulations across a process pool")
+    parser.add_argument("maps", nargs="+", help="map files in JSON format")
+    parser.add_argument("--runs", type=int, default=100, help="runs per map")
+    parser.add_argument("--ticks", type=int, default=600, help="ticks per run")
+    parser.add_argument("--seed", type=int, default=0, help="base seed for per-run seeds")
+    parser.add_argument("--objects", type=int, default=Map.OBJECTS_COUNT, help="number of moving objects")
+    parser.add_argument("--engine", choices=ENGINES, default=ENGINES[0], help="simulation engine")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes (default: CPU count)")
+    parser.add_argument("--output", metavar="JSONL", help="stream per-run results to a JSON Lines file")
+    args = parser.parse_args(argv)
+
+    tasks = make_tasks(args.maps, args.runs, args.ticks, args.seed, args.objects, args.engine)
+    aggregates: Dict[str, Aggregate] = {map_file: Aggregate() for map_file in args.maps}
+    start = time.perf_counter()
+    with open(args.output, "w") if args.output else open(os.devnull, "w") as output:
+        for result in run_batch(tasks, args.workers):
+            aggregates[result.map_file].add(result, args.objects)
+            output.write(json.dumps(asdict(result)) + "\n")
+    elapsed = time.perf_counter() - start
+
+    for map_file, aggregate in aggregates.items():
+        print(map_file, json.dumps(aggregate.summary()))
+    print(f"{len(tasks)} runs in {elapsed:.2f} s ({len(tasks) / elapsed:.1f} runs/s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
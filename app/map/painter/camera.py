@@ -0,0 +1,67 @@
+from dataclasses import dataclass, replace
+from typing import Tuple
+
+from ..map_ import DIMENSION
+
+
+@dataclass(frozen=True)
+class Camera:
+    # Видимая часть мира: квадрат left, top, size x size в координатах мира,
+    # растянутый на окно window_size. Неизменяема: сдвиг и масштаб дают новую камеру
+    left: int
+    top: int
+    size: int
+    window_size: Tuple[int, int]
+    # Самый крупный масштаб: столько единиц мира на всё окно
+    MIN_SIZE = 50
+
+    @classmethod
+    def for_world(cls, dimension: int, window_size: Tuple[int, int],
+                  center: Tuple[int, int] = None, size: int = DIMENSION) -> "Camera":
+        # Небольшой мир виден целиком, на большом камера показывает size единиц вокруг center
+        camera = cls(0, 0, min(size, dimension), window_size)
+        if center is None:
+            return camera
+        return camera.centered(*center, dimension)
+
+    @property
+    def view(self) -> Tuple[int, int, int, int]:
+        # Видимая область мира: left, top, right, bottom
+        return self.left, self.top, self.left + self.size, self.top + self.size
+
+    def contains(self, x: int, y: int) -> bool:
+        return self.left <= x < self.left + self.size and self.top <= y < self.top + self.size
+
+    def intersects(self, left: int, top: int, right: int, bottom: int) -> bool:
+        return left < self.left + self.size and right > self.left and \
+            top < self.top + self.size and bottom > self.top
+
+    def to_screen(self, x: int, y: int) -> Tuple[int, int]:
+        width, height = self.window_size
+        return int((x - self.left) * width / self.size), int((y - self.top) * height / self.size)
+
+    def to_world(self, x: int, y: int) -> Tuple[int, int]:
+        width, height = self.window_size
+        return self.left + int(x * self.size / width), self.top + int(y * self.size / height)
+
+    def scale(self, length: int) -> int:
+        # Длина в пикселях по горизонтали, например радиус круга
+        return int(length * self.window_size[0] / self.size)
+
+    def centered(self, x: int, y: int, dimension: int) -> "Camera":
+        return self._clamped(x - self.size // 2, y - self.size // 2, self.size, dimension)
+
+    def panned(self, dx: int, dy: int, dimension: int) -> "Camera":
+        return self._clamped(self.left + dx, self.top + dy, self.size, dimension)
+
+    def zoomed(self, factor: float, anchor: Tuple[int, int], dimension: int) -> "Camera":
+        # Масштаб вокруг точки окна anchor: точка мира под ней остаётся на месте
+        size = min(max(int(self.size * factor), self.MIN_SIZE), dimension)
+        x, y = self.to_world(*anchor)
+        width, height = self.window_size
+        return self._clamped(x - int(anchor[0] * size / width), y - int(anchor[1] * size / height), size, dimension)
+
+    def _clamped(self, left: int, top: int, size: int, dimension: int) -> "Camera":
+        # Камера не выходит за края мира
+        limit = max(dimension - size, 0)
+        return replace(self, left=min(max(left, 0), limit), top=min(max(top, 0), limit), size=size)
@@ -1,51 +1,186 @@
-from typing import Tuple
+from dataclasses import replace
+from itertools import product
+from typing import Tuple, Optional, List, Sequence
 
-from PySide6.QtGui import QColor, QPainter, QBrush
-from PySide6.QtCore import QRect, Qt, QPoint
+from PySide6.QtGui import QColor, QPainter, QBrush, QPixmap, QRegion
+from PySide6.QtCore import QRect, Qt
 
-from ..map_ import Map, Rect, DIMENSION, Circle
+from ..loading import LoadProgress
+from ..map_ import Map, Rect, DIMENSION
+from ..simulation import Snapshot
+from .camera import Camera
 
 
 class MapPainter:
-    _map: Map
-    _window_size: Tuple[int, int]
+    # Рисует часть мира, видимую через камеру: и границы, и объекты берутся только
+    # из видимой области, поэтому стоимость кадра не зависит от размера мира
+    _map: Optional[Map]
+    _camera: Camera
+    _border_layer: QPixmap = None
+    _border_layer_key: tuple = None
+    _radii: List[int] = None
+    _brushes: Tuple[Tuple[QBrush, bool], ...]
     BORDER_COLOR = QColor("black")
     TARGET_CIRCLE_COLOR = QColor("red")
     NON_TARGET_CIRCLE_COLOR = QColor("blue")
+    LOADING_COLOR = QColor("gray")
+    # Запас в пикселях на перо и округление координат при перерисовке области
+    DIRTY_MARGIN = 2
+    # Больше областей объединять дороже, чем перерисовать окно целиком
+    MAX_DIRTY_RECTS = 256
 
-    def __init__(self, map_: Map, window_size: Tuple[int, int]):
+    def __init__(self, map_: Optional[Map], window_size: Tuple[int, int]):
+        # Без карты художник в состоянии загрузки: рисует только paint_loading
+        self._camera = Camera.for_world(DIMENSION, window_size)
+        # Цель рисуется последней, поверх остальных кругов
+        self._brushes = ((QBrush(self.NON_TARGET_CIRCLE_COLOR, Qt.BrushStyle.SolidPattern), False),
+                         (QBrush(self.TARGET_CIRCLE_COLOR, Qt.BrushStyle.SolidPattern), True))
+        self.map = map_
+
+    @property
+    def map(self) -> Optional[Map]:
+        return self._map
+
+    @map.setter
+    def map(self, map_: Optional[Map]):
+        # Смена карты сбрасывает все кэши разом, отрисовка сразу идёт по новой карте.
+        # Камера смотрит на цель: на большом мире весь он в окно не помещается
         self._map = map_
-        self._window_size = window_size
+        if map_ is not None:
+            self.camera = Camera.for_world(map_.dimension, self._camera.window_size, map_.target.pos.to_tuple())
+        self._border_layer = None
+        self._radii = None
+
+    @property
+    def camera(self) -> Camera:
+        return self._camera
+
+    @camera.setter
+    def camera(self, camera: Camera):
+        if camera != self._camera:
+            self._radii = None
+        self._camera = camera
 
     @property
     def window_size(self) -> Tuple[int, int]:
-        return self._window_size
+        return self._camera.window_size
 
     @window_size.setter
     def window_size(self, window_size: Tuple[int, int]):
-        self._window_size = window_size
+        self.camera = replace(self._camera, window_size=window_size)
+
+    def paint_loading(self, painter: QPainter, progress: LoadProgress):
+        # Полоса прогресса с названием этапа посередине окна
+        width, height = self.window_size
+        bar = QRect(width // 4, height // 2 - 10, width // 2, 20)
+        painter.setPen(self.LOADING_COLOR)
+        painter.setBrush(Qt.BrushStyle.NoBrush)
+        painter.drawRect(bar)
+        painter.fillRect(QRect(bar.x(), bar.y(), int(bar.width() * progress.fraction), bar.height()),
+                         self.LOADING_COLOR)
+        painter.drawText(QRect(bar.x(), bar.y() - 30, bar.width(), 24),
+                         Qt.AlignmentFlag.AlignCenter, f"{progress.stage}... {progress.fraction:.0%}")
+
+    def paint_objects(self, painter: QPainter, snapshot: Optional[Snapshot] = None):
+        if self._map is None:
+            return
+        # С симуляцией в отдельном потоке положения берутся из снимка, а не из живой карты
+        targets = self._map.targets_view
+        positions = snapshot.positions if snapshot else [obj.pos.to_tuple() for obj in targets]
+        # При частичной перерисовке пропускаем объекты вне области отсечения
+        clip = painter.clipRegion() if painter.hasClipping() else None
+        painter.drawPixmap(0, 0, self._get_border_layer(painter.device().devicePixelRatioF()))
+
+        to_screen = self._camera.to_screen
+        radii = self._get_radii()
+        visible = self._visible_objects(positions, snapshot)
+        for brush, is_target in self._brushes:
+            painter.setBrush(brush)
+            for i in visible:
+                if targets[i].is_target is not is_target:
+                    continue
+                if clip is not None and not clip.intersects(self._ellipse_rect(positions[i], targets[i].radius)):
+                    continue
+                x, y = to_screen(*positions[i])
+                radius = radii[i]
+                # То же, что drawEllipse(QPoint(x, y), radius, radius), но без создания QPoint
+                painter.drawEllipse(x - radius, y - radius, radius * 2, radius * 2)
+
+    def _visible_objects(self, positions: Sequence[Tuple[int, int]], snapshot: Optional[Snapshot]) -> List[int]:
+        # Номера объектов, круги которых могут попасть в камеру, по возрастанию
+        margin = self._map.max_radius
+        left, top, right, bottom = self._camera.view
+        left, top, right, bottom = left - margin, top - margin, right + margin, bottom + margin
+        if snapshot is None or snapshot.buckets is None:
+            candidates = range(len(positions))
+        else:
+            size, buckets = snapshot.BUCKET_SIZE, snapshot.buckets
+            x0, x1, y0, y1 = left // size, (right - 1) // size, top // size, (bottom - 1) // size
+            if (x1 - x0 + 1) * (y1 - y0 + 1) > len(buckets):
+                # Камера охватывает больше квадратов, чем занято объектами
+                candidates = [i for (x, y), bucket in buckets.items() if x0 <= x <= x1 and y0 <= y <= y1
+                              for i in bucket]
+            else:
+                candidates = [i for cell in product(range(x0, x1 + 1), range(y0, y1 + 1))
+                              for i in buckets.get(cell, ())]
+            candidates.sort()
+        return [i for i in candidates if left <= positions[i][0] < right and top <= positions[i][1] < bottom]
+
+    def _get_radii(self) -> List[int]:
+        if self._radii is None:
+            self._radii = [self._camera.scale(obj.radius) for obj in self._map.targets_view]
+        return self._radii
+
+    def dirty_region(self, previous: Snapshot, current: Snapshot) -> QRegion:
+        # Область окна, которую нужно перерисовать при переходе от снимка previous к current
+        if current.sequence == previous.sequence + 1:
+            boxes = current.dirty
+        else:
+            # Часть снимков пропущена: сравниваем положения напрямую
+            targets = self._map.targets
+            boxes = [box for obj, old, new in zip(targets, previous.positions, current.positions) if old != new
+                     for box in (obj.bounding_rect(old), obj.bounding_rect(new))]
+        # Объекты за пределами камеры окно не меняют
+        intersects = self._camera.intersects
+        boxes = [box for box in boxes if intersects(box.corner.x, box.corner.y,
+                                                    box.corner.x + box.width, box.corner.y + box.height)]
+        if len(boxes) > self.MAX_DIRTY_RECTS:
+            return QRegion(0, 0, *self.window_size)
+        region = QRegion()
+        for box in boxes:
+            radius = box.width // 2
+            region = region.united(self._ellipse_rect((box.corner.x + radius, box.corner.y + radius), radius))
+        return region
+
+    def _ellipse_rect(self, pos: Tuple[int, int], radius: int) -> QRect:
+        # Прямоугольник окна, который занимает круг при отрисовке, с запасом на перо
+        x, y = self._translate_coord(pos)
+        radius = self._camera.scale(radius) + self.DIRTY_MARGIN
+        return QRect(x - radius, y - radius, radius * 2 + 1, radius * 2 + 1)
 
-    def paint_objects(self, painter: QPainter):
-        for obj in self._map.borders:
-            rect = self._rect_to_qt_rect(obj)
-            painter.fillRect(rect, self.BORDER_COLOR)
-        for obj in self._map.targets:
-            color = self.TARGET_CIRCLE_COLOR if obj.is_target else self.NON_TARGET_CIRCLE_COLOR
-            painter.setBrush(QBrush(color, Qt.BrushStyle.SolidPattern))
-            painter.drawEllipse(*self._circle_to_draw_ellipse_args(obj))
+    def _get_border_layer(self, pixel_ratio: float) -> QPixmap:
+        # Границы неподвижны: рисуем их один раз и перерисовываем только при сдвиге камеры,
+        # смене размера, плотности пикселей или самих границ (карта тогда строит новый индекс).
+        # В слой попадают только границы в пределах камеры
+        key = (self._camera, self._map.border_index)
+        layer = self._border_layer
+        if layer is None or layer.devicePixelRatioF() != pixel_ratio or self._border_layer_key != key:
+            width, height = self.window_size
+            layer = QPixmap(max(int(width * pixel_ratio), 1), max(int(height * pixel_ratio), 1))
+            layer.setDevicePixelRatio(pixel_ratio)
+            layer.fill(Qt.GlobalColor.transparent)
+            layer_painter = QPainter(layer)
+            layer_painter.setPen(Qt.PenStyle.NoPen)
+            layer_painter.setBrush(self.BORDER_COLOR)
+            borders = self._map.border_index.query(*self._camera.view)
+            layer_painter.drawRects([self._rect_to_qt_rect(obj) for obj in borders])
+            layer_painter.end()
+            self._border_layer = layer
+            self._border_layer_key = key
+        return layer
 
     def _translate_coord(self, coord: Tuple[int, int]) -> Tuple[int, int]:
-        width, height = self._window_size
-        x, y = coord
-        return int(x * width / DIMENSION), int(y * height / DIMENSION)
-
-    def _circle_to_draw_ellipse_args(self, circle: Circle) -> Tuple[QPoint, int, int]:
-        point = QPoint()
-        x, y = self._translate_coord(circle.pos.to_tuple())
-        point.setX(x)
-        point.setY(y)
-        radius = int(circle.radius * self._window_size[0] / DIMENSION)
-        return point, radius, radius
+        return self._camera.to_screen(*coord)
 
     def _rect_to_qt_rect(self, rect: Rect):
         x, y = self._translate_coord(rect.corner.to_tuple())
@@ -0,0 +1,61 @@
+import argparse
+import csv
+import sys
+import time
+from contextlib import nullcontext
+
+from .loaders import JsonLoader
+from .map_ import Map, SequentialEngine, EventEngine
+
+ENGINES = ("sequential", "event", "batch")
+
+
+def make_engine(map_: Map, name: str):
+    if name == "batch":
+        # NumPy нужен только для пакетного движка
+        from .batch import BatchEngine
+        return BatchEngine(map_)
+    if name == "event":
+        return EventEngine(map_)
+    return SequentialEngine(map_)
+
+
+def run(map_: Map, ticks: int, trajectories=None) -> float:
+    # Прогоняет карту ticks тиков без задержек и возвращает затраченное время в секундах
+    writer = csv.writer(trajectories) if trajectories else None
+    if writer:
+        writer.writerow(("tick", "object", "x", "y"))
+    start = time.perf_counter()
+    for tick in range(1, ticks + 1):
+        map_.process()
+        if writer:
+            writer.writerows((tick, index, obj.pos.x, obj.pos.y) for index, obj in enumerate(map_.targets))
+    return time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.map.run",
+                                     description="Run a map simulation without Qt and report its throughput")
+    parser.add_argument("map", help="map file in JSON format")
+    parser.add_argument("--ticks", type=int, default=1000, help="number of ticks to simulate")
+    parser.add_argument("--seed", type=int, default=None, help="seed for object spawning and movement")
+    parser.add_argument("--objects", type=int, default=Map.OBJECTS_COUNT, help="number of moving objects")
+    parser.add_argument("--engine", choices=ENGINES, default=ENGINES[0], help="simulation engine")
+    parser.add_argument("--trajectories", metavar="CSV", help="write object positions after every tick")
+    args = parser.parse_args(argv)
+
+    Map.OBJECTS_COUNT = args.objects
+    map_ = JsonLoader(args.map).load(seed=args.seed)
+    map_.engine = make_engine(map_, args.engine)
+
+    with open(args.trajectories, "w", newline="") if args.trajectories else nullcontext() as trajectories:
+        elapsed = run(map_, args.ticks, trajectories)
+    map_.engine.flush()
+
+    print(f"{args.ticks} ticks, {len(map_.targets)} objects, engine={args.engine}: "
+          f"{elapsed:.3f} s, {args.ticks / elapsed if elapsed else float('inf'):.1f} ticks/s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
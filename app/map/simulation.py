@@ -0,0 +1,105 @@
+import math
+import threading
+import time
+from dataclasses import dataclass
+from typing import Tuple, List, Dict
+
+from .map_ import Map, Point, Rect
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    # Неизменяемый срез положения объектов после очередного тика
+    tick: int
+    positions: Tuple[Tuple[int, int], ...]  # В порядке Map.targets
+    target_index: int
+    target_radius: int
+    sequence: int = 0  # Номер публикации: по нему видно, пропущены ли снимки
+    dirty: Tuple[Rect, ...] = ()  # Области мира, изменившиеся с предыдущего снимка
+    # Номера объектов по квадратам мира BUCKET_SIZE x BUCKET_SIZE: отрисовка берёт
+    # только квадраты в пределах камеры, а не перебирает все объекты
+    buckets: Dict[Tuple[int, int], List[int]] = None
+    BUCKET_SIZE = 256
+
+    @property
+    def target_pos(self) -> Point:
+        return Point(*self.positions[self.target_index])
+
+    def collide_with_target(self, pos: Point) -> bool:
+        x, y = self.positions[self.target_index]
+        return math.hypot(x - pos.x, y - pos.y) <= self.target_radius
+
+
+class SimulationWorker(threading.Thread):
+    # Продвигает карту с фиксированной частотой в отдельном потоке. Читатели получают
+    # последний Snapshot: ссылка на него подменяется целиком, поэтому блокировки не нужны.
+    TICK_RATE = 60
+    MAX_CATCH_UP_TICKS = 5
+    _map: Map
+    _snapshot: Snapshot
+    _tick: int
+    _sequence: int = 0
+    _dirty: List[Rect]
+
+    def __init__(self, map_: Map, tick_rate: int = TICK_RATE):
+        super().__init__(daemon=True, name="simulation")
+        self._map = map_
+        self._tick_time = 1 / tick_rate
+        self._tick = 0
+        self._dirty = []
+        self._running = threading.Event()
+        self._stopped = threading.Event()
+        self._target_index = map_.targets.index(map_.target)
+        self._publish()
+
+    def _publish(self):
+        self._sequence += 1
+        positions = tuple(obj.pos.to_tuple() for obj in self._map.targets_view)
+        buckets, size = {}, Snapshot.BUCKET_SIZE
+        for i, (x, y) in enumerate(positions):
+            buckets.setdefault((x // size, y // size), []).append(i)
+        self._snapshot = Snapshot(tick=self._tick,
+                                  positions=positions,
+                                  target_index=self._target_index,
+                                  target_radius=self._map.target.radius,
+                                  sequence=self._sequence,
+                                  dirty=tuple(self._dirty),
+                                  buckets=buckets)
+        self._dirty = []
+
+    def run(self):
+        next_tick = time.perf_counter()
+        while not self._stopped.is_set():
+            if not self._running.wait(timeout=0.1) or self._stopped.is_set():
+                next_tick = time.perf_counter()
+                continue
+            now = time.perf_counter()
+            if now < next_tick:
+                time.sleep(next_tick - now)
+                continue
+
+            ticks = 0
+            while next_tick <= now and ticks < self.MAX_CATCH_UP_TICKS:
+                for boxes in self._map.process():
+                    self._dirty.extend(boxes)
+                self._tick += 1
+                next_tick += self._tick_time
+                ticks += 1
+            if next_tick <= now:
+                # Слишком сильно отстали: пропускаем тики, а не ускоряем симуляцию
+                next_tick = now + self._tick_time
+            self._publish()
+
+    def resume(self):
+        self._running.set()
+
+    def pause(self):
+        self._running.clear()
+
+    def stop(self):
+        self._stopped.set()
+        self._running.set()
+
+    @property
+    def snapshot(self) -> Snapshot:
+        return self._snapshot
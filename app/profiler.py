@@ -0,0 +1,151 @@
+import json
+import os
+import time
+from array import array
+from typing import Dict, List, Tuple, Any
+
+
+class RingBuffer:
+    # Последние capacity замеров фиксированного размера: начало и длительность в секундах
+    # perf_counter. Пишет в буфер один поток, поэтому блокировки не нужны.
+    __slots__ = ("_starts", "_durations", "_capacity", "count")
+
+    def __init__(self, capacity: int):
+        self._capacity = capacity
+        self._starts = array("d", bytes(8 * capacity))
+        self._durations = array("d", bytes(8 * capacity))
+        self.count = 0
+
+    def add(self, start: float, duration: float):
+        index = self.count % self._capacity
+        self._starts[index] = start
+        self._durations[index] = duration
+        self.count += 1
+
+    def samples(self) -> List[Tuple[float, float]]:
+        # Замеры от старых к новым
+        count = min(self.count, self._capacity)
+        first = self.count - count
+        return [(self._starts[i % self._capacity], self._durations[i % self._capacity])
+                for i in range(first, first + count)]
+
+    def percentile(self, q: float) -> float:
+        durations = sorted(duration for _, duration in self.samples())
+        if not durations:
+            return 0.0
+        return durations[min(int(len(durations) * q), len(durations) - 1)]
+
+    def rate(self, now: float, window: float = 1.0) -> float:
+        # Замеров в секунду за последние window секунд
+        return sum(1 for start, _ in self.samples() if start >= now - window) / window
+
+
+class FrameProfiler:
+    # Профилировщик кадра. Замеряемые методы подменяются обёрткой на самом объекте
+    # только на время включения, поэтому выключенный профилировщик ничего не стоит.
+    CAPACITY = 1024
+    FRAME_SECTION = "frame"
+    enabled: bool = False
+    _hooks: List[Tuple[Any, str, str]]
+    _sections: Dict[str, RingBuffer]
+
+    def __init__(self, capacity: int = CAPACITY):
+        self._capacity = capacity
+        self._hooks = []
+        self._sections = {}
+        self._last_frame = None
+
+    def instrument(self, obj: Any, method: str, section: str = None):
+        # Замерять вызовы obj.method() в разделе section (по умолчанию - имя метода)
+        hook = (obj, method, section or method.strip("_"))
+        self._hooks.append(hook)
+        if self.enabled:
+            self._install(*hook)
+
+    def _buffer(self, section: str) -> RingBuffer:
+        buffer = self._sections.get(section)
+        if buffer is None:
+            buffer = self._sections[section] = RingBuffer(self._capacity)
+        return buffer
+
+    def _install(self, obj: Any, method: str, section: str):
+        func = getattr(obj, method)
+        buffer = self._buffer(section)
+        perf_counter = time.perf_counter
+
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                buffer.add(start, perf_counter() - start)
+        setattr(obj, method, timed)
+
+    def enable(self):
+        if self.enabled:
+            return
+        for hook in self._hooks:
+            self._install(*hook)
+        self._last_frame = None
+        self.enabled = True
+
+    def disable(self):
+        if not self.enabled:
+            return
+        for obj, method, _ in self._hooks:
+            # Убираем обёртку с экземпляра, снова виден метод класса
+            obj.__dict__.pop(method, None)
+        self.enabled = False
+
+    def toggle(self):
+        if self.enabled:
+            self.disable()
+        else:
+            self.enable()
+
+    def frame(self):
+        # Отметка начала кадра: длительность кадра - время от предыдущей отметки
+        now = time.perf_counter()
+        if self._last_frame is not None:
+            buffer = self._buffer(self.FRAME_SECTION)
+            buffer.add(self._last_frame, now - self._last_frame)
+        self._last_frame = now
+
+    def stats(self, rate_sections: Tuple[str, ...] = ()) -> Dict[str, float]:
+        # Сводка для оверлея: кадры в секунду, p50/p99 кадра и каждого раздела в мс,
+        # и частота вызовов разделов rate_sections в секунду
+        now = time.perf_counter()
+        frames = self._buffer(self.FRAME_SECTION)
+        stats = {"fps": frames.rate(now),
+                 "frame_p50_ms": frames.percentile(0.5) * 1e3,
+                 "frame_p99_ms": frames.percentile(0.99) * 1e3}
+        for name, buffer in self._sections.items():
+            if name != self.FRAME_SECTION:
+                stats[f"{name}_p50_ms"] = buffer.percentile(0.5) * 1e3
+                stats[f"{name}_p99_ms"] = buffer.percentile(0.99) * 1e3
+        for name in rate_sections:
+            stats[f"{name}_per_s"] = self._buffer(name).rate(now)
+        return stats
+
+    def export_json(self, filename: str):
+        sections = {name: {"count": buffer.count,
+                           "p50_ms": buffer.percentile(0.5) * 1e3,
+                           "p99_ms": buffer.percentile(0.99) * 1e3,
+                           "samples": buffer.samples()}
+                    for name, buffer in self._sections.items()}
+        with open(filename, "w") as f:
+            json.dump({"capacity": self._capacity, "sections": sections}, f)
+
+    def export_chrome_trace(self, filename: str):
+        # Формат Trace Event: открывается в chrome://tracing и Perfetto
+        # Секция - отдельная строка трека: своя tid и имя в метаданных thread_name,
+        # иначе секции одного потока наложатся друг на друга
+        pid = os.getpid()
+        events = [{"name": name, "ph": "X", "pid": pid, "tid": tid, "ts": start * 1e6, "dur": duration * 1e6}
+                  for tid, (name, buffer) in enumerate(self._sections.items(), 1)
+                  for start, duration in buffer.samples()]
+        events.sort(key=lambda event: event["ts"])
+        events[:0] = ({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+                      for tid, name in enumerate(self._sections, 1))
+        with open(filename, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
@@ -0,0 +1,126 @@
+import argparse
+import datetime
+import os
+import re
+import struct
+import time
+from enum import IntEnum
+from typing import Iterator, Union
+
+import numpy as np
+
+HEADER = b"HMIREC01"
+RECORD = struct.Struct("<dIii")  # Время (секунды Unix), тип события, x, y
+RECORD_DTYPE = np.dtype([("timestamp", "<f8"), ("event", "<u4"), ("x", "<i4"), ("y", "<i4")])
+LOG_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+LOG_LINE = re.compile(r"^(?P<time>\d{4}-\d\d-\d\d \d\d:\d\d:\d\d) - (?:"
+                      r"(?P<name>Координаты мыши|Координаты цели): X=(?P<x>-?\d+), Y=(?P<y>-?\d+)|"
+                      r"Цель достигнута x=(?P<reached_x>-?\d+) y=(?P<reached_y>-?\d+)|"
+                      r"Столкновение с границей x=(?P<hit_x>-?\d+) y=(?P<hit_y>-?\d+))$")
+
+
+class RecordingException(Exception):
+    pass
+
+
+class EventType(IntEnum):
+    CURSOR = 1
+    TARGET = 2
+    TARGET_REACHED = 3
+    BORDER_HIT = 4
+
+
+LOG_EVENT_NAMES = {
+    "Координаты мыши": EventType.CURSOR,
+    "Координаты цели": EventType.TARGET,
+}
+
+
+class SessionRecorder:
+    # Дописывает события сессии в двоичный файл записями фиксированного размера
+    def __init__(self, filename: str, append: bool = True):
+        self._file = open(filename, "ab" if append else "wb")
+        if self._file.tell() == 0:
+            self._file.write(HEADER)
+
+    def record(self, event: EventType, x: int, y: int, timestamp: float = None):
+        self._file.write(RECORD.pack(time.time() if timestamp is None else timestamp, event, x, y))
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self) -> "SessionRecorder":
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+class SessionReader:
+    # Отображает файл записи в память: срезы и поля - представления без копирования
+    _records: np.ndarray
+
+    def __init__(self, filename: str):
+        with open(filename, "rb") as f:
+            if f.read(len(HEADER)) != HEADER:
+                raise RecordingException(f"Not a session recording: {filename}")
+        size = os.path.getsize(filename) - len(HEADER)
+        count = size // RECORD_DTYPE.itemsize
+        if count:
+            self._records = np.memmap(filename, dtype=RECORD_DTYPE, mode="r", offset=len(HEADER), shape=(count,))
+        else:
+            self._records = np.empty(0, dtype=RECORD_DTYPE)
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __getitem__(self, item: Union[int, slice]) -> np.ndarray:
+        return self._records[item]
+
+    def __iter__(self) -> Iterator[np.void]:
+        return iter(self._records)
+
+    def events(self, event: EventType) -> np.ndarray:
+        return self._records[self._records["event"] == event]
+
+    @property
+    def records(self) -> np.ndarray:
+        return self._records
+
+
+def convert_log(log_filename: str, recording_filename: str) -> int:
+    # Переводит текстовый лог сессии в двоичную запись, возвращает число событий
+    count = 0
+    with open(log_filename, encoding="UTF-8") as log, SessionRecorder(recording_filename, append=False) as recorder:
+        for line in log:
+            match = LOG_LINE.match(line.rstrip("\n"))
+            if match is None:
+                continue
+            timestamp = datetime.datetime.strptime(match["time"], LOG_DATE_FORMAT).timestamp()
+            if match["name"]:
+                recorder.record(LOG_EVENT_NAMES[match["name"]], int(match["x"]), int(match["y"]), timestamp)
+            elif match["hit_x"]:
+                recorder.record(EventType.BORDER_HIT, int(match["hit_x"]), int(match["hit_y"]), timestamp)
+            else:
+                recorder.record(EventType.TARGET_REACHED, int(match["reached_x"]), int(match["reached_y"]),
+                                timestamp)
+            count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert session .log files to binary recordings")
+    parser.add_argument("logs", nargs="+", help="text session logs")
+    parser.add_argument("--force", action="store_true", help="overwrite existing recordings")
+    args = parser.parse_args()
+    for log_filename in args.logs:
+        recording_filename = os.path.splitext(log_filename)[0] + ".rec"
+        if os.path.exists(recording_filename) and not args.force:
+            print(f"{log_filename}: {recording_filename} already exists, skipping")
+            continue
+        count = convert_log(log_filename, recording_filename)
+        print(f"{log_filename} -> {recording_filename}: {count} events")
+
+
+if __name__ == "__main__":
+    main()
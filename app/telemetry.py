@@ -0,0 +1,93 @@
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+from typing import List, Optional
+
+
+class TelemetryHandler(logging.handlers.QueueHandler):
+    # Кладёт запись в очередь как есть: форматирование откладывается до потока записи.
+    # Если очередь переполнена, запись отбрасывается, а не блокирует вызывающий поток.
+    def __init__(self, sink: "TelemetrySink"):
+        super().__init__(sink.queue)
+        self._sink = sink
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self._sink.dropped += 1
+        else:
+            self._sink.queued += 1
+
+
+class TelemetrySink:
+    # Поток записи логов в файл пачками: сброс на диск по размеру пачки или по времени
+    MAX_QUEUE_SIZE = 100_000
+    BATCH_SIZE = 512
+    FLUSH_INTERVAL_S = 0.5
+    _STOP = object()
+    queued: int = 0
+    dropped: int = 0
+    written: int = 0
+
+    def __init__(self, filename: str, fmt: str = None, datefmt: str = None, encoding: str = "UTF-8",
+                 batch_size: int = BATCH_SIZE, flush_interval: float = FLUSH_INTERVAL_S,
+                 max_queue_size: int = MAX_QUEUE_SIZE):
+        self._filename = filename
+        self._encoding = encoding
+        self._formatter = logging.Formatter(fmt, datefmt)
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._queue = queue.Queue(max_queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self.handler = TelemetryHandler(self)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True, name="telemetry")
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._queue.put(self._STOP)
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        buffer: List[str] = []
+        with open(self._filename, "a", encoding=self._encoding) as file:
+            deadline = time.monotonic() + self._flush_interval
+            while True:
+                try:
+                    record = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    record = None
+                if record is self._STOP:
+                    self._write(file, buffer)
+                    return
+                if record is not None:
+                    buffer.append(self._formatter.format(record))
+                if len(buffer) >= self._batch_size or time.monotonic() >= deadline:
+                    self._write(file, buffer)
+                    buffer = []
+                    deadline = time.monotonic() + self._flush_interval
+
+    def _write(self, file, buffer: List[str]):
+        if not buffer:
+            return
+        file.write("\n".join(buffer) + "\n")
+        file.flush()
+        self.written += len(buffer)
+
+    @property
+    def queue(self) -> queue.Queue:
+        return self._queue
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
@@ -1,15 +1,20 @@
 import logging
 import datetime
 import os
-from typing import Tuple
+from typing import List
 
 from PySide6 import QtWidgets, QtGui, QtCore
 from PySide6.QtCore import QPoint
 from PySide6.QtGui import QPainter
 
-from app.map import Map, JsonLoader, Point
-from app.map.map_ import DIMENSION
+from app.map import Map, Point
+from app.map.loading import MapLoadWorker
 from app.map.painter import MapPainter
+from app.map.painter.camera import Camera
+from app.map.simulation import SimulationWorker, Snapshot
+from app.profiler import FrameProfiler
+from app.recording import SessionRecorder, EventType
+from app.telemetry import TelemetrySink
 from app.windows.ui.main_window import Ui_MainWindow
 from app.windows.auth_dialog import AuthDialog
 from app.windows.dto.user import User
@@ -22,13 +27,32 @@ if not os.path.exists(LOG_DIR):
 
 
 class MainWindow(QtWidgets.QMainWindow):
-    _map: Map
+    _map: Map = None
+    _simulation: SimulationWorker = None
+    _loader: MapLoadWorker = None
+    _frame_snapshot: Snapshot = None
     _painter: QPainter
     _map_painter: MapPainter = None
     _last_cursor_pos: QPoint = None
+    _pending_moves: List[QPoint]
     _user: User = None
+    _telemetry: TelemetrySink = None
+    _recorder: SessionRecorder = None
     _paused: bool = True
+    _profiler: FrameProfiler
     TIMER_TIME_MS = 16
+    LOADING_TIMER_TIME_MS = 50
+    # Профилировщик: F3 - включить и показать оверлей, F4 - сохранить замеры в LOG_DIR
+    PROFILER_KEY = QtCore.Qt.Key_F3
+    PROFILER_EXPORT_KEY = QtCore.Qt.Key_F4
+    PROFILER_OVERLAY_RECT = QtCore.QRect(8, 8, 280, 112)
+    # Камера: колесо мыши меняет масштаб, стрелки сдвигают вид на долю его размера,
+    # Home возвращает камеру к цели
+    ZOOM_FACTOR = 0.8
+    PAN_FRACTION = 0.25
+    PAN_KEYS = {QtCore.Qt.Key_Left: (-1, 0), QtCore.Qt.Key_Right: (1, 0),
+                QtCore.Qt.Key_Up: (0, -1), QtCore.Qt.Key_Down: (0, 1)}
+    CENTER_KEY = QtCore.Qt.Key_Home
 
     def __init__(self):
         super().__init__()
@@ -39,58 +63,133 @@ class MainWindow(QtWidgets.QMainWindow):
         auth_dialog = AuthDialog(self)
         auth_dialog.exec()
 
-        file = QtWidgets.QFileDialog.getOpenFileName()
-        self._map = JsonLoader(file[0]).load()
+        self._pending_moves = []
+        self._profiler = FrameProfiler()
+        self._profiler.instrument(self, "_cursor_return")
+        self._profiler.instrument(self, "mouseMoveEvent", "mouse_move")
+        self._profiler.instrument(self, "_log_position")
 
         self.resize(800, 600)
         self.ui.start_game_btn.clicked.connect(self._start_game)
+        # До загрузки карты играть нечем
+        self.ui.start_game_btn.setDisabled(True)
 
         def paint_widget_resize_event(_):
             if self._map_painter is None:
                 self._map_painter = MapPainter(self._map, (self.ui.paint_widget.width(),
                                                            self.ui.paint_widget.height()))
+                self._profiler.instrument(self._map_painter, "paint_objects", "paint")
             else:
                 self._map_painter.window_size = (self.ui.paint_widget.width(), self.ui.paint_widget.height())
         self.ui.paint_widget.resizeEvent = paint_widget_resize_event
 
         self._painter = QPainter(self.ui.paint_widget)
-        self.update_speed(self._map.target.speed)
-        self.ui.speed_slider.setRange(0, self._map.OBJECT_MAX_SPEED)
         self.ui.speed_slider.setSingleStep(1)
-        self.ui.speed_slider.setValue(self._map.target.speed)
+        self.ui.speed_slider.setDisabled(True)
         self.ui.speed_slider.valueChanged.connect(self.update_speed)
 
         self._timer = QtCore.QTimer(self)
         self._timer.timeout.connect(self._timer_event)
+        self._loading_timer = QtCore.QTimer(self)
+        self._loading_timer.timeout.connect(self._loading_timer_event)
         self.ui.centralwidget.setMouseTracking(False)
+        # Выбор файла - после показа окна, чтобы окно появлялось сразу
+        QtCore.QTimer.singleShot(0, self._choose_map)
+
+    def _choose_map(self):
+        filename, _ = QtWidgets.QFileDialog.getOpenFileName(self)
+        if not filename:
+            self.close()
+            return
+        # Разбор, расстановка объектов и построение индексов - в отдельном потоке,
+        # окно тем временем показывает прогресс
+        self._loader = MapLoadWorker(filename)
+        self._loader.start()
+        self._loading_timer.start(self.LOADING_TIMER_TIME_MS)
+
+    def _loading_timer_event(self):
+        if not self._loader.done:
+            self.update()
+            return
+        self._loading_timer.stop()
+        try:
+            map_ = self._loader.result()
+        except Exception as e:
+            # Любая ошибка загрузки - повод выбрать другой файл, а не зависнуть на прогрессе
+            QtWidgets.QMessageBox.critical(self, "Ошибка", f"Не удалось загрузить карту: {e}")
+            self._choose_map()
+            return
+        self._set_map(map_)
+
+    def _set_map(self, map_: Map):
+        # Переключение на готовую карту целиком в потоке интерфейса, между двумя кадрами
+        self._map = map_
+        self._simulation = SimulationWorker(map_)
+        self._profiler.instrument(map_, "process", "tick")
+        self._simulation.start()
+        if self._map_painter is not None:
+            self._map_painter.map = map_
+
+        self.ui.speed_slider.setRange(0, map_.OBJECT_MAX_SPEED)
+        self.ui.speed_slider.setValue(map_.target.speed)
+        self.update_speed(map_.target.speed)
+        self.ui.speed_slider.setEnabled(True)
+        self.ui.start_game_btn.setEnabled(True)
+        self.update()
 
     def _start_game(self):
+        if self._simulation is None:
+            return
         qpoint = QPoint(20, 20)
         self.cursor().setPos(self.mapToGlobal(qpoint))
         self._last_cursor_pos = qpoint
+        self._pending_moves = []
         self.ui.start_game_btn.setDisabled(True)
         self.ui.start_game_btn.setVisible(False)
         self.ui.centralwidget.setMouseTracking(True)
         self._timer.start(self.TIMER_TIME_MS)  # Обновление каждые 16 мс (примерно 60 кадров в секунду)
+        self._simulation.resume()
         self._paused = False
 
     def _stop_game(self):
+        # Пока карта загружается, останавливать нечего, а кнопка старта остаётся выключенной
+        if self._simulation is None:
+            return
         self.ui.start_game_btn.setEnabled(True)
         self.ui.start_game_btn.setVisible(True)
         self.ui.centralwidget.setMouseTracking(False)
         self._timer.stop()
+        self._simulation.pause()
         self._paused = True
 
     def update_speed(self, value):
         self.ui.speed_slider_label.setText(f"Скорость: {value}")
-        self._map.target.speed = value
+        if self._map is not None:
+            self._map.target.speed = value
 
     def _timer_event(self):
-        self._map.process()
-        qpoint = point_to_q_point(self._map.target.pos, (self.ui.paint_widget.width(),
-                                                         self.ui.paint_widget.height()))
+        # Симуляция идёт в своём потоке, здесь только отрисовка последнего снимка
+        if self._profiler.enabled:
+            self._profiler.frame()
+        self._process_input()
+        if self._paused:
+            return
+        snapshot = self._simulation.snapshot
+        qpoint = point_to_q_point(snapshot.target_pos, self._map_painter.camera)
         self._log_position(qpoint, "Координаты цели")
-        self.update()
+        self._record(EventType.TARGET, qpoint)
+
+        # Перерисовываем только места, где объекты были и куда сдвинулись
+        previous, self._frame_snapshot = self._frame_snapshot, snapshot
+        if previous is None:
+            self.update()
+        elif snapshot is not previous:
+            region = self._map_painter.dirty_region(previous, snapshot)
+            if self._profiler.enabled:
+                region = region.united(self.PROFILER_OVERLAY_RECT)
+            self.update(region)
+        elif self._profiler.enabled:
+            self.update(self.PROFILER_OVERLAY_RECT)
 
     def showEvent(self, event):
         super().showEvent(event)
@@ -98,61 +197,149 @@ class MainWindow(QtWidgets.QMainWindow):
     def keyPressEvent(self, event):
         if event.key() == QtCore.Qt.Key_Escape:
             self._stop_game()
+        elif event.key() == self.PROFILER_KEY:
+            self._profiler.toggle()
+            self.update()
+        elif event.key() == self.PROFILER_EXPORT_KEY:
+            filename = os.path.join(LOG_DIR, f"profile_{current_time}")
+            self._profiler.export_json(filename + ".json")
+            self._profiler.export_chrome_trace(filename + ".trace.json")
+        elif self._map is not None and event.key() in self.PAN_KEYS:
+            camera = self._map_painter.camera
+            dx, dy = self.PAN_KEYS[event.key()]
+            step = int(camera.size * self.PAN_FRACTION)
+            self._set_camera(camera.panned(dx * step, dy * step, self._map.dimension))
+        elif self._map is not None and event.key() == self.CENTER_KEY:
+            target = self._simulation.snapshot.target_pos
+            self._set_camera(self._map_painter.camera.centered(target.x, target.y, self._map.dimension))
+
+    def wheelEvent(self, event):
+        if self._map is None or not event.angleDelta().y():
+            return
+        factor = self.ZOOM_FACTOR if event.angleDelta().y() > 0 else 1 / self.ZOOM_FACTOR
+        anchor = event.position().toPoint()
+        self._set_camera(self._map_painter.camera.zoomed(factor, (anchor.x(), anchor.y()), self._map.dimension))
+
+    def _set_camera(self, camera: Camera):
+        # Во время игры курсор остаётся в той же точке мира: он переносится туда, где эта
+        # точка оказалась на экране, а если она ушла из вида - камера встаёт вокруг неё
+        # Накопленные движения мыши относятся к старой камере: разбираем их до смены
+        self._process_input()
+        if not self._paused and self._last_cursor_pos is not None:
+            point = q_point_to_point(self._last_cursor_pos, self._map_painter.camera)
+            if not camera.contains(point.x, point.y):
+                camera = camera.centered(point.x, point.y, self._map.dimension)
+            self._last_cursor_pos = point_to_q_point(point, camera)
+            self.cursor().setPos(self.mapToGlobal(self._last_cursor_pos))
+        self._map_painter.camera = camera
+        # Сдвиг камеры меняет всё окно
+        self.update()
 
     @staticmethod
     def _log_position(pos: QPoint, pos_object_name: str = "Координаты мыши"):
-        x = pos.x()
-        y = pos.y()
-        logging.info(f"{pos_object_name}: X={x}, Y={y}")
-
-    def _cursor_return(self, pos: QPoint):
-        window_size = (self.ui.paint_widget.width(), self.ui.paint_widget.height())
-        current_point = q_point_to_point(pos, window_size)
-
-        if self._last_cursor_pos:
-            last_point = q_point_to_point(self._last_cursor_pos, window_size)
-
-            # Количество шагов для проверки промежуточных точек
-            steps = 20
-            for i in range(1, steps + 1):
-                # Линейная интерполяция между последней и текущей позицией
-                interp_x = last_point.x + (current_point.x - last_point.x) * i / steps
-                interp_y = last_point.y + (current_point.y - last_point.y) * i / steps
-                intermediate_point = Point(int(interp_x), int(interp_y))
-
-                if self._map.collide_with_borders(intermediate_point):
-                    # Возвращаем курсор в последнее допустимое положение
-                    self.cursor().setPos(self.mapToGlobal(self._last_cursor_pos))
+        # Аргументы подставляются в строку уже в потоке записи телеметрии
+        logging.info("%s: X=%d, Y=%d", pos_object_name, pos.x(), pos.y())
+
+    def _record(self, event: EventType, pos: QPoint):
+        if self._recorder is not None:
+            self._recorder.record(event, pos.x(), pos.y())
+
+    def _cursor_return(self, path: List[QPoint]):
+        # Путь курсора за кадр проверяется отрезок за отрезком до первого столкновения:
+        # результат тот же, что при проверке каждого события по отдельности.
+        # Границы-кандидаты выбираются из индекса один раз на весь путь
+        camera = self._map_painter.camera
+        last_point = q_point_to_point(self._last_cursor_pos, camera) if self._last_cursor_pos else None
+        points = [q_point_to_point(pos, camera) for pos in path]
+        borders = self._map.border_index.query_path(([last_point] if last_point is not None else []) + points)
+        snapshot = self._simulation.snapshot
+        for pos, current_point in zip(path, points):
+            if last_point is not None:
+                # Точная проверка всего отрезка по кандидатам пути
+                stop_point = self._map.sweep_segment(last_point, current_point, borders)
+                if stop_point is not None:
+                    # Возвращаем курсор в последнее допустимое положение на пути
+                    stop_pos = point_to_q_point(stop_point, camera)
+                    if self._map.collide_with_borders(q_point_to_point(stop_pos, camera)):
+                        stop_pos = self._last_cursor_pos
+                    logging.info("Столкновение с границей x=%d y=%d", pos.x(), pos.y())
+                    self._record(EventType.BORDER_HIT, pos)
+                    self.cursor().setPos(self.mapToGlobal(stop_pos))
+                    self._last_cursor_pos = stop_pos
                     return
 
-        # Если нет столкновения, обновляем последнее положение курсора
-        if self._map.collide_with_target(current_point):
-            logging.info(f"Цель достигнута x={pos.x()} y={pos.y()}")
-            self._timer.stop()
-            dlg = QtWidgets.QMessageBox(self)
-            dlg.setWindowTitle("Конец")
-            dlg.setText("Цель достигнута")
-            dlg.resize(250, 50)
-            dlg.exec()
-            self._stop_game()
-        else:
+            # Если нет столкновения, обновляем последнее положение курсора
+            if snapshot.collide_with_target(current_point):
+                logging.info("Цель достигнута x=%d y=%d", pos.x(), pos.y())
+                self._record(EventType.TARGET_REACHED, pos)
+                self._timer.stop()
+                self._simulation.pause()
+                dlg = QtWidgets.QMessageBox(self)
+                dlg.setWindowTitle("Конец")
+                dlg.setText("Цель достигнута")
+                dlg.resize(250, 50)
+                dlg.exec()
+                self._stop_game()
+                return
             self._last_cursor_pos = pos
+            last_point = current_point
+
+    def _process_input(self):
+        # Все движения мыши с прошлого кадра: каждое попадает в лог и запись сессии,
+        # а проверка столкновений идёт один раз по всему пути
+        path, self._pending_moves = self._pending_moves, []
+        if not path:
+            return
+        for pos in path:
+            self._log_position(pos)
+            self._record(EventType.CURSOR, pos)
+        self._cursor_return(path)
 
     def mouseMoveEvent(self, event):
         if self._paused:
             return
-
-        pos = QtGui.QCursor.pos()
-        # Преобразуем глобальные координаты в координаты внутри окна
-        local_pos = self.mapFromGlobal(pos)
-        self._log_position(local_pos)
-        self._cursor_return(local_pos)
+        # Мышь с высокой частотой опроса присылает событий больше, чем кадров:
+        # здесь точка только запоминается, разбор - в _process_input раз в кадр.
+        # Положение берётся из события, а не из QCursor.pos(), - это та же точка окна
+        pos = event.position().toPoint()
+        path = self._pending_moves
+        if not path or path[-1] != pos:
+            path.append(pos)
 
     def paintEvent(self, event):
         self._painter.begin(self)
-        self._map_painter.paint_objects(self._painter)
+        self._painter.setClipRegion(event.region())
+        if self._map is None:
+            if self._loader is not None:
+                self._map_painter.paint_loading(self._painter, self._loader.progress)
+        else:
+            self._map_painter.paint_objects(self._painter, self._frame_snapshot or self._simulation.snapshot)
+        if self._profiler.enabled:
+            self._paint_profiler_overlay(self._painter)
         self._painter.end()
 
+    def _paint_profiler_overlay(self, painter: QPainter):
+        stats = self._profiler.stats(rate_sections=("mouse_move",))
+        lines = (f"FPS: {stats['fps']:.0f}",
+                 f"Кадр: p50 {stats['frame_p50_ms']:.1f} мс, p99 {stats['frame_p99_ms']:.1f} мс",
+                 f"Тик: p50 {stats.get('tick_p50_ms', 0):.2f} мс, p99 {stats.get('tick_p99_ms', 0):.2f} мс",
+                 f"Отрисовка: p50 {stats.get('paint_p50_ms', 0):.2f} мс, "
+                 f"p99 {stats.get('paint_p99_ms', 0):.2f} мс",
+                 f"События мыши: {stats['mouse_move_per_s']:.0f}/с")
+        rect = self.PROFILER_OVERLAY_RECT
+        painter.fillRect(rect, QtGui.QColor(255, 255, 255, 220))
+        painter.setPen(QtGui.QColor("black"))
+        painter.drawText(rect.adjusted(6, 4, -6, -4), QtCore.Qt.AlignLeft | QtCore.Qt.AlignTop, "\n".join(lines))
+
+    def closeEvent(self, event):
+        if self._simulation is not None:
+            self._simulation.stop()
+        if self._telemetry is not None:
+            self._telemetry.stop()
+        if self._recorder is not None:
+            self._recorder.close()
+        super().closeEvent(event)
+
     @property
     def user(self) -> User:
         return self._user
@@ -163,29 +350,30 @@ class MainWindow(QtWidgets.QMainWindow):
             " ", "_")
                                     )
 
-        logging.basicConfig(
-            filename=log_filename,  # Лог будет сохраняться в файл "mouse_position.log"
-            level=logging.INFO,  # Устанавливаем уровень логирования
-            format='%(asctime)s - %(message)s',  # Формат сообщения с указанием времени
+        # Запись в файл идёт пачками в отдельном потоке, а не в потоке интерфейса
+        self._telemetry = TelemetrySink(
+            log_filename,
+            fmt='%(asctime)s - %(message)s',  # Формат сообщения с указанием времени
             datefmt='%Y-%m-%d %H:%M:%S',  # Формат времени
             encoding='UTF-8'
         )
+        self._telemetry.start()
+        # Двоичная запись тех же событий рядом с текстовым логом
+        self._recorder = SessionRecorder(os.path.splitext(log_filename)[0] + ".rec")
+        logging.basicConfig(
+            level=logging.INFO,  # Устанавливаем уровень логирования
+            handlers=[self._telemetry.handler]
+        )
 
         self._user = user
 
 
-def q_point_to_point(qpoint: QPoint, window_size: Tuple[int, int]) -> Point:
-    width, height = window_size
-    return Point(
-        int(qpoint.x() * DIMENSION / width),
-        int(qpoint.y() * DIMENSION / height)
-    )
+def q_point_to_point(qpoint: QPoint, camera: Camera) -> Point:
+    return Point(*camera.to_world(qpoint.x(), qpoint.y()))
 
 
-def point_to_q_point(point: Point, window_size: Tuple[int, int]) -> QPoint:
-    width, height = window_size
-    x, y = point.to_tuple()
-    x, y = int(x * width / DIMENSION), int(y * height / DIMENSION)
+def point_to_q_point(point: Point, camera: Camera) -> QPoint:
+    x, y = camera.to_screen(*point.to_tuple())
     qpoint = QPoint()
     qpoint.setX(x)
     qpoint.setY(y)
@@ -0,0 +1,47 @@
+import random
+import timeit
+
+from app.map.map_ import Map, Point, Circle, DIMENSION
+from benchmarks.common import random_borders
+
+BORDER_COUNTS = (10, 100, 1000)
+POINTS_COUNT = 10_000
+REPEAT = 5
+
+
+def main():
+    rng = random.Random(0)
+    target = Circle(Point(-100, -100), True, speed=0, speed_vector=Point(0, 0))
+    points = [Point(rng.randrange(DIMENSION), rng.randrange(DIMENSION)) for _ in range(POINTS_COUNT)]
+    circles = [Circle(point, False, speed=0, speed_vector=Point(0, 0)) for point in points]
+    print(f"{'borders':>8} {'query':>7} {'linear, us':>12} {'indexed, us':>12} {'speedup':>8}")
+    for count in BORDER_COUNTS:
+        borders = random_borders(count, rng)
+        map_ = Map(borders, targets=[target])
+
+        def linear_points():
+            for point in points:
+                any(border.contains(point) for border in borders)
+
+        def indexed_points():
+            for point in points:
+                map_.collide_with_borders(point)
+
+        def linear_circles():
+            for circle in circles:
+                any(border.collide(circle) for border in borders)
+
+        def indexed_circles():
+            for circle in circles:
+                map_.collide_with_borders(circle)
+
+        for name, linear, indexed in (("point", linear_points, indexed_points),
+                                      ("circle", linear_circles, indexed_circles)):
+            linear_time = min(timeit.repeat(linear, number=1, repeat=REPEAT)) / POINTS_COUNT * 1e6
+            indexed_time = min(timeit.repeat(indexed, number=1, repeat=REPEAT)) / POINTS_COUNT * 1e6
+            print(f"{count:>8} {name:>7} {linear_time:>12.3f} {indexed_time:>12.3f} "
+                  f"{linear_time / indexed_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
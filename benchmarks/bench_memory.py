@@ -0,0 +1,47 @@
+import gc
+import os
+import time
+import tracemalloc
+
+from app.map import JsonLoader
+from app.map.map_ import Map, Point, Rect, Circle
+
+MAP_FILE = os.path.join(os.path.dirname(__file__), os.pardir, "app", "map.json")
+OBJECTS_COUNT = 100_000
+TICKS = 50
+
+
+def bytes_per_object(factory) -> float:
+    tracemalloc.start()
+    objects = [factory(i) for i in range(OBJECTS_COUNT)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objects
+    return size / OBJECTS_COUNT
+
+
+def main():
+    print(f"Point:  {bytes_per_object(lambda i: Point(i, i)):8.1f} B")
+    print(f"Rect:   {bytes_per_object(lambda i: Rect(Point(i, i), 1, 1)):8.1f} B")
+    print(f"Circle: {bytes_per_object(lambda i: Circle(Point(i, i), False, 1, Point(0, 1))):8.1f} B")
+
+    Map.OBJECTS_COUNT = 100
+    map_ = JsonLoader(MAP_FILE, cache=False).load(seed=0)
+    # Плитки поля расстояний строятся по первому обращению: в замер они попасть не должны
+    map_.distance_field.warm((x, y) for x in range(0, map_.dimension, map_.distance_field.TILE_SIZE)
+                             for y in range(0, map_.dimension, map_.distance_field.TILE_SIZE))
+    collections = sum(stat["collections"] for stat in gc.get_stats())
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(TICKS):
+        map_.process()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    collections = sum(stat["collections"] for stat in gc.get_stats()) - collections
+    print(f"process, {Map.OBJECTS_COUNT} objects x {TICKS} ticks: peak {peak / 1024:.1f} KiB, "
+          f"{collections} GC collections, {elapsed / TICKS * 1e3:.2f} ms/tick (traced)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+import json
+import random
+from typing import List
+
+from app.map.map_ import Rect, Point, DIMENSION
+
+
+def random_borders(count: int, rng: random.Random, max_size: int = 50, dimension: int = DIMENSION) -> List[Rect]:
+    borders = []
+    for _ in range(count):
+        x, y = rng.randrange(dimension - max_size), rng.randrange(dimension - max_size)
+        borders.append(Rect(Point(x, y), width=rng.randint(1, max_size), height=rng.randint(1, max_size)))
+    return borders
+
+
+def write_json_map(filename: str, borders: List[Rect], dimension: int = None):
+    data = {"borders": [{"point": {"x": b.corner.x, "y": b.corner.y}, "width": b.width, "height": b.height}
+                        for b in borders]}
+    if dimension is not None:
+        data["dimension"] = dimension
+    with open(filename, "w") as f:
+        json.dump(data, f)
@@ -0,0 +1,289 @@
+import argparse
+import atexit
+import fnmatch
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from typing import Callable, Dict
+
+from app.map import JsonLoader, StreamingJsonLoader
+from app.map.map_ import Map, Circle, Point, ObjectGrid, SequentialEngine, EventEngine, DIMENSION
+from benchmarks.common import random_borders, write_json_map
+
+MAP_FILE = os.path.join(os.path.dirname(__file__), os.pardir, "app", "map.json")
+MIN_TIME_S = 0.2
+REPEAT = 5
+REGRESSION_THRESHOLD = 0.1
+
+# Имя замера -> функция подготовки, которая возвращает замеряемый вызов
+BENCHMARKS: Dict[str, Callable[[], Callable[[], object]]] = {}
+
+
+def benchmark(name: str):
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+def temp_dir() -> str:
+    # Один временный каталог на запуск для сгенерированных карт и их кэшей, удаляется при выходе
+    if not hasattr(temp_dir, "directory"):
+        temp_dir.directory = tempfile.TemporaryDirectory(prefix="benchmarks-")
+        atexit.register(temp_dir.directory.cleanup)
+    return temp_dir.directory.name
+
+
+def make_map(objects: int, speed: int = None, seed: int = 0) -> Map:
+    map_ = JsonLoader(MAP_FILE, cache=False).load(seed=seed)
+    map_.OBJECTS_COUNT = objects
+    targets = map_._generate_targets()
+    for obj in targets:
+        obj.speed = speed if speed is not None else obj.speed
+    return Map(map_.borders, targets=targets, seed=seed)
+
+
+for _objects in (15, 1000):
+    @benchmark(f"generate_targets/{_objects}")
+    def _generate_targets_setup(objects=_objects):
+        map_ = make_map(15)
+        map_.OBJECTS_COUNT = objects
+        return map_._generate_targets
+
+
+for _engine, _objects_counts, _speeds in (("sequential", (15, 100), (1, 10)), ("event", (15, 100), (1, 10, 100)),
+                                         ("batch", (15, 100, 1000), (1, 10))):
+    for _objects in _objects_counts:
+        for _speed in _speeds:
+            @benchmark(f"process/{_engine}/{_objects}x{_speed}")
+            def _process_setup(engine=_engine, objects=_objects, speed=_speed):
+                map_ = make_map(objects, speed)
+                if engine == "batch":
+                    from app.map.batch import BatchEngine
+                    map_.engine = BatchEngine(map_)
+                elif engine == "event":
+                    map_.engine = EventEngine(map_)
+                else:
+                    map_.engine = SequentialEngine(map_)
+                return map_.process
+
+
+for _borders in (10, 1000):
+    @benchmark(f"collide/point/{_borders}")
+    def _collide_point_setup(borders=_borders):
+        rng = random.Random(0)
+        map_ = Map(random_borders(borders, rng), targets=[Circle(Point(-100, -100), True, 0, Point(0, 0))])
+        points = [Point(rng.randrange(DIMENSION), rng.randrange(DIMENSION)) for _ in range(1000)]
+        return lambda: [map_.collide_with_borders(point) for point in points]
+
+    @benchmark(f"collide/circle/{_borders}")
+    def _collide_circle_setup(borders=_borders):
+        rng = random.Random(0)
+        map_ = Map(random_borders(borders, rng), targets=[Circle(Point(-100, -100), True, 0, Point(0, 0))])
+        circles = [Circle(Point(rng.randrange(DIMENSION), rng.randrange(DIMENSION)), False, 0, Point(0, 0))
+                   for _ in range(1000)]
+        # Плитки поля расстояний строятся при первом обращении, это не часть замера
+        map_.distance_field.warm(circle.pos.to_tuple() for circle in circles)
+        return lambda: [map_.collide_with_borders(circle) for circle in circles]
+
+
+for _objects in (1000, 5000):
+    @benchmark(f"collide/objects/{_objects}")
+    def _collide_objects_setup(objects=_objects):
+        rng = random.Random(0)
+        circles = [Circle(Point(rng.randrange(DIMENSION), rng.randrange(DIMENSION)), False, 1,
+                          Point(*rng.choice(((0, 1), (0, -1), (1, 0), (-1, 0))))) for _ in range(objects)]
+        grid = ObjectGrid(circles)
+
+        def collide():
+            for circle in circles:
+                circle.pos.x += circle.speed_vector.x
+                circle.pos.y += circle.speed_vector.y
+            grid.update()
+            return grid.colliding_pairs()
+        return collide
+
+
+@benchmark("loader/small")
+def _loader_small_setup():
+    return lambda: JsonLoader(MAP_FILE, cache=False).load(seed=0)
+
+
+def cached_loader(filename: str) -> Callable[[], Map]:
+    # Загрузка из скомпилированного кэша рядом с filename: первая загрузка его пишет
+    JsonLoader(filename).load(seed=0)
+    return lambda: JsonLoader(filename).load(seed=0)
+
+
+@benchmark("loader/small/cached")
+def _loader_small_cached_setup():
+    # Копия карты во временном каталоге, чтобы замер не оставлял кэш рядом с app/map.json
+    filename = os.path.join(temp_dir(), "map.json")
+    shutil.copyfile(MAP_FILE, filename)
+    return cached_loader(filename)
+
+
+LARGE_WORLD = 100_000
+
+
+def make_large_world(objects: int, borders: int = 100_000, seed: int = 0) -> Map:
+    # Мир 100k x 100k: стоимость кадра должна зависеть от видимой части, а не от площади
+    rng = random.Random(seed)
+    map_ = Map(random_borders(borders, rng, dimension=LARGE_WORLD), seed=seed, dimension=LARGE_WORLD)
+    map_.OBJECTS_COUNT = objects
+    return Map(map_.borders, targets=map_._generate_targets(), seed=seed, dimension=LARGE_WORLD,
+               occupancy=map_.occupancy, border_index=map_.border_index)
+
+
+@benchmark("process/batch/large-world/1000x10")
+def _process_large_world_setup():
+    from app.map.batch import BatchEngine
+    map_ = make_large_world(1000)
+    for obj in map_.targets_view:
+        obj.speed = 10
+    map_.engine = BatchEngine(map_)
+    return map_.process
+
+
+def huge_map_file() -> str:
+    if not hasattr(huge_map_file, "filename"):
+        huge_map_file.filename = os.path.join(temp_dir(), "huge.json")
+        write_json_map(huge_map_file.filename, random_borders(100_000, random.Random(0), max_size=5))
+    return huge_map_file.filename
+
+
+@benchmark("loader/huge")
+def _loader_huge_setup():
+    filename = huge_map_file()
+    return lambda: JsonLoader(filename, cache=False).load(seed=0)
+
+
+@benchmark("loader/huge/cached")
+def _loader_huge_cached_setup():
+    return cached_loader(huge_map_file())
+
+
+@benchmark("loader/huge/streaming")
+def _loader_huge_streaming_setup():
+    filename = huge_map_file()
+    return lambda: StreamingJsonLoader(filename).load(seed=0)
+
+
+for _name, _borders, _objects in (("paint/10", 10, 15), ("paint/1000", 1000, 15),
+                                  ("paint/1000/1000-objects", 1000, 1000)):
+    @benchmark(_name)
+    def _paint_setup(borders=_borders, objects=_objects):
+        # Qt - необязательная зависимость для этого замера
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        from PySide6.QtGui import QGuiApplication, QImage, QPainter
+        from app.map.painter import MapPainter
+
+        if QGuiApplication.instance() is None:
+            _paint_setup.app = QGuiApplication([])
+        map_ = make_map(objects)
+        map_.borders = random_borders(borders, random.Random(0))
+        size = (1280, 960)
+        image = QImage(*size, QImage.Format.Format_ARGB32_Premultiplied)
+        map_painter = MapPainter(map_, size)
+
+        def paint():
+            painter = QPainter(image)
+            map_painter.paint_objects(painter)
+            painter.end()
+        return paint
+
+
+@benchmark("paint/large-world/10000-objects")
+def _paint_large_world_setup():
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PySide6.QtGui import QGuiApplication, QImage, QPainter
+    from app.map.painter import MapPainter
+    from app.map.simulation import SimulationWorker
+
+    if QGuiApplication.instance() is None:
+        _paint_large_world_setup.app = QGuiApplication([])
+    map_ = make_large_world(10_000)
+    # Снимок публикуется уже в конструкторе, сам поток не запускается
+    snapshot = SimulationWorker(map_).snapshot
+    size = (1280, 960)
+    image = QImage(*size, QImage.Format.Format_ARGB32_Premultiplied)
+    map_painter = MapPainter(map_, size)
+
+    def paint():
+        painter = QPainter(image)
+        map_painter.paint_objects(painter, snapshot)
+        painter.end()
+    return paint
+
+
+def measure(func: Callable[[], object], min_time: float = MIN_TIME_S, repeat: int = REPEAT) -> float:
+    # Лучшее среднее время одного вызова в секундах из repeat серий длительностью не меньше min_time
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number = max(number * 2, int(number * min_time / elapsed) if elapsed else number * 10)
+    best = elapsed / number
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.suite", description="Map core and painter benchmarks")
+    parser.add_argument("patterns", nargs="*", default=["*"], help="glob patterns of benchmark names")
+    parser.add_argument("--save", metavar="JSON", help="save results as a baseline")
+    parser.add_argument("--compare", metavar="JSON", help="compare results with a saved baseline")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help="relative slowdown reported as a regression")
+    parser.add_argument("--min-time", type=float, default=MIN_TIME_S, help="minimal duration of one series")
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+
+    results, regressions = {}, []
+    for name, setup in BENCHMARKS.items():
+        if not any(fnmatch.fnmatch(name, pattern) for pattern in args.patterns):
+            continue
+        try:
+            func = setup()
+        except ImportError as e:
+            print(f"{name:<32} skipped: {e}")
+            continue
+        results[name] = measure(func, args.min_time)
+        line = f"{name:<32} {results[name] * 1e3:>12.4f} ms"
+        if name in baseline:
+            ratio = results[name] / baseline[name]
+            line += f" {ratio:>7.2f}x"
+            if ratio > 1 + args.threshold:
+                regressions.append(name)
+                line += " REGRESSION"
+        print(line)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"python": platform.python_version(), "platform": platform.platform(),
+                       "results": results}, f, indent=2)
+    if regressions:
+        print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,12 @@
+import pytest
+
+from app.map.map_ import Map, Point, Circle
+
+
+@pytest.fixture
+def make_map():
+    # Карта только с заданными границами: цель вдали от них, чтобы карта не генерировала объекты сама.
+    # Остальные аргументы уходят в Map, например свой border_index
+    def make(borders, **kwargs):
+        return Map(borders, targets=[Circle(Point(-1000, -1000), True, 0, Point(0, 0))], seed=0, **kwargs)
+    return make
@@ -0,0 +1,54 @@
+import copy
+import os
+import random
+
+import pytest
+
+from app.map import JsonLoader
+from app.map.map_ import Map, EventEngine
+from benchmarks.common import random_borders
+
+MAP_FILE = os.path.join(os.path.dirname(__file__), os.pardir, "app", "map.json")
+OBJECTS = 30
+TICKS = 60
+
+
+def run_both(borders, targets, seed):
+    # Два одинаковых мира: один на SequentialEngine, другой на EventEngine
+    sequential = Map(borders, targets=copy.deepcopy(targets), seed=seed)
+    event = Map(borders, targets=copy.deepcopy(targets), seed=seed)
+    event.engine = EventEngine(event)
+    for tick in range(TICKS):
+        sequential.process()
+        event.process()
+        assert [c.pos for c in sequential.targets] == [c.pos for c in event.targets], tick
+        assert [c.speed_vector for c in sequential.targets] == [c.speed_vector for c in event.targets], tick
+        assert [c.bounding_sides for c in sequential.targets] == [c.bounding_sides for c in event.targets], tick
+    # Те же случайные выборы и те же выталкивания
+    assert sequential.random.getstate() == event.random.getstate()
+    assert sequential.engine.push_outs == event.engine.push_outs
+    assert sequential.engine.target_push_outs == event.engine.target_push_outs
+
+
+def make_targets(borders, seed, speed):
+    # Объекты генерирует сама карта; speed None - случайные скорости
+    map_ = Map(borders, seed=seed)
+    map_.OBJECTS_COUNT = OBJECTS
+    targets = map_._generate_targets()
+    rng = random.Random(seed)
+    for obj in targets:
+        obj.speed = rng.randint(1, 60) if speed is None else speed
+    return targets
+
+
+@pytest.mark.parametrize("speed", [None, 10, 37])
+@pytest.mark.parametrize("seed", range(6))
+def test_event_engine_matches_sequential(seed, speed):
+    borders = JsonLoader(MAP_FILE, cache=False).load().borders
+    run_both(borders, make_targets(borders, seed, speed), seed)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_event_engine_matches_sequential_on_random_borders(seed):
+    borders = random_borders(300, random.Random(seed))
+    run_both(borders, make_targets(borders, seed, 20), seed)
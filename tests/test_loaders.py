@@ -0,0 +1,124 @@
+import hashlib
+import io
+import json
+import os
+
+import pytest
+
+from app.map import JsonLoader, StreamingJsonLoader
+from app.map.loaders import CompiledLoader, MapLoaderException
+
+# Числа разной длины и знака, лишние ключи с вложенными значениями и пробелы между токенами:
+# при маленьком буфере каждый токен где-нибудь разрезается
+DOCUMENT = json.dumps({
+    "name": "test \"map\" [1, 2]",
+    "borders": [{"point": {"x": x, "y": -y}, "width": 1 + x % 7, "height": 123456 + y}
+                for x, y in ((0, 1), (12, 34), (1005, 99999), (7, 3))],
+    "meta": {"nested": [1, [2, {"deep": None}], True, -0.5e3]},
+    "dimension": 2500,
+}, indent=1)
+
+
+def stream(text: str, chunk_size: int):
+    return StreamingJsonLoader(io.StringIO(text), chunk_size).load(seed=0)
+
+
+@pytest.mark.parametrize("chunk_size", range(1, 18))
+def test_streaming_matches_json_loader(chunk_size):
+    expected = JsonLoader(io.StringIO(DOCUMENT)).load(seed=0)
+    map_ = stream(DOCUMENT, chunk_size)
+    assert map_.borders == expected.borders
+    assert map_.dimension == expected.dimension == 2500
+
+
+@pytest.mark.parametrize("chunk_size", (1, 2, 3, 16, 1 << 16))
+def test_streaming_allows_trailing_whitespace(chunk_size):
+    assert stream('{"borders": []} \n\t', chunk_size).borders == []
+
+
+@pytest.mark.parametrize("chunk_size", (1, 2, 3, 16, 1 << 16))
+@pytest.mark.parametrize("text", [
+    '{"borders": [], "x": [1,2,3]} trailing',
+    '{"borders": []}{}',
+    '{"borders": []} ]',
+    '',
+    '[]',
+    '{"borders": [}',
+    '{"borders": [{"point": {"x": 1, "y": 2}, "width": 3, "height": 4},]}',
+    '{"borders": [{"point": {"x": 1, "y": 2}, "width": 3, "height": 4}',
+    '{"borders" []}',
+    '{"borders": [] "dimension": 10}',
+    '{"borders": [], }',
+    '{"dimension": 10}',
+    '{"borders": [1]}',
+    '{"borders": [{"point": {"x": 1}, "width": 3, "height": 4}]}',
+    '{"borders": [{"point": {"x": 1.5, "y": 2}, "width": 3, "height": 4}]}',
+    '{"borders": [{"point": {"x": 1, "y": 2}, "width": 0, "height": 4}]}',
+    '{"borders": [], "dimension": -1}',
+    '{"borders": [], "dimension": true}',
+    '{"borders": [], "x": tru}',
+    '{"borders": [], "x": "unterminated}',
+])
+def test_streaming_rejects_malformed(text, chunk_size):
+    with pytest.raises(MapLoaderException):
+        stream(text, chunk_size)
+
+
+def write_map(path, borders, dimension=300):
+    path.write_text(json.dumps({"dimension": dimension, "borders": [
+        {"point": {"x": x, "y": y}, "width": width, "height": height} for x, y, width, height in borders]}))
+    return str(path)
+
+
+BORDERS = [(0, 0, 300, 5), (10, 40, 7, 90), (150, 150, 40, 40), (290, 0, 10, 300), (-20, 280, 60, 60)]
+
+
+def assert_same_map(map_, expected):
+    assert map_.borders == expected.borders
+    assert map_.dimension == expected.dimension
+    assert map_.targets == expected.targets
+    assert map_.occupancy.free_count == expected.occupancy.free_count
+    assert {cell: bytes(chunk) for cell, chunk in map_.occupancy.chunks.items()} == \
+        {cell: bytes(chunk) for cell, chunk in expected.occupancy.chunks.items()}
+    assert map_.border_index.buckets == expected.border_index.buckets
+
+
+def test_compiled_cache_round_trip(tmp_path):
+    filename = write_map(tmp_path / "map.json", BORDERS)
+    expected = JsonLoader(filename, cache=False).load(seed=7)
+    assert not os.path.exists(filename + CompiledLoader.EXTENSION)
+    # Первая загрузка разбирает JSON и пишет кэш, вторая читает только кэш
+    assert_same_map(JsonLoader(filename).load(seed=7), expected)
+    assert os.path.exists(filename + CompiledLoader.EXTENSION)
+    assert_same_map(CompiledLoader(filename + CompiledLoader.EXTENSION).load(seed=7), expected)
+    assert_same_map(JsonLoader(filename).load(seed=7), expected)
+
+
+def test_compiled_cache_invalidated_by_source_change(tmp_path):
+    filename = write_map(tmp_path / "map.json", BORDERS)
+    JsonLoader(filename).load(seed=0)
+    write_map(tmp_path / "map.json", BORDERS[:2])
+    with pytest.raises(MapLoaderException):
+        CompiledLoader(filename + CompiledLoader.EXTENSION, hashlib.sha256((tmp_path / "map.json").read_bytes()).digest())
+    assert_same_map(JsonLoader(filename).load(seed=0), JsonLoader(filename, cache=False).load(seed=0))
+    # Устаревший кэш переписан по новому исходнику
+    assert_same_map(CompiledLoader(filename + CompiledLoader.EXTENSION).load(seed=0),
+                    JsonLoader(filename, cache=False).load(seed=0))
+
+
+@pytest.mark.parametrize("damage", ["empty", "truncated", "magic", "extended"])
+def test_damaged_compiled_cache_is_ignored(tmp_path, damage):
+    filename = write_map(tmp_path / "map.json", BORDERS)
+    JsonLoader(filename).load(seed=0)
+    compiled = filename + CompiledLoader.EXTENSION
+    with open(compiled, "rb") as f:
+        data = f.read()
+    data = {"empty": b"",
+            "truncated": data[:len(data) // 2],
+            "magic": b"NOTAMAP!" + data[8:],
+            "extended": data + b"\0"}[damage]
+    with open(compiled, "wb") as f:
+        f.write(data)
+    with pytest.raises((MapLoaderException, ValueError)):
+        CompiledLoader(compiled)
+    assert_same_map(JsonLoader(filename).load(seed=3), JsonLoader(filename, cache=False).load(seed=3))
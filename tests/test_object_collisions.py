@@ -0,0 +1,35 @@
+from app.map.map_ import Map, Point, Circle
+
+
+def test_target_keeps_its_speed():
+    target = Circle(Point(100, 100), True, speed=0, speed_vector=Point(1, 0))
+    other = Circle(Point(110, 100), False, speed=5, speed_vector=Point(-1, 0))
+    map_ = Map([], targets=[target, other], seed=0)
+    map_.process()
+    assert map_.engine.object_collisions == 1
+    # Скорость цели задана пользователем: меняются только направления
+    assert (target.speed, other.speed) == (0, 5)
+    assert target.speed_vector == Point(-1, 0) and other.speed_vector == Point(1, 0)
+
+
+def test_objects_exchange_speeds():
+    target = Circle(Point(500, 500), True, speed=0, speed_vector=Point(1, 0))
+    a = Circle(Point(100, 100), False, speed=1, speed_vector=Point(1, 0))
+    b = Circle(Point(110, 100), False, speed=3, speed_vector=Point(-1, 0))
+    map_ = Map([], targets=[target, a, b], seed=0)
+    map_.process()
+    assert (a.speed, b.speed) == (3, 1)
+    assert a.speed_vector == Point(-1, 0) and b.speed_vector == Point(1, 0)
+
+
+def test_coincident_centres_separate():
+    target = Circle(Point(500, 500), True, speed=0, speed_vector=Point(1, 0))
+    a = Circle(Point(100, 100), False, speed=1, speed_vector=Point(1, 0))
+    b = Circle(Point(100, 100), False, speed=1, speed_vector=Point(1, 0))
+    map_ = Map([], targets=[target, a, b], seed=0)
+    map_.process()
+    assert map_.engine.object_collisions == 1
+    assert a.speed_vector == Point(1, 0) and b.speed_vector == Point(-1, 0)
+    for _ in range(20):
+        map_.process()
+    assert a.pos != b.pos
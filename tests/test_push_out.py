@@ -0,0 +1,27 @@
+import random
+
+from app.map.map_ import Rect, Point, Circle
+
+
+def test_nearest_free_leaves_wall(make_map):
+    map_ = make_map([Rect(Point(100, 100), 100, 100)])
+    free = map_.distance_field.nearest_free(110, 150, 3, map_.collide_square)
+    # Ближайший выход - через левый край: квадрат радиуса 3 вплотную к стене
+    assert free == (97, 150)
+
+
+def test_nearest_free_gives_up_beyond_radius(make_map):
+    map_ = make_map([Rect(Point(0, 0), 500, 500)])
+    assert map_.distance_field.nearest_free(250, 250, 3, map_.collide_square, search_radius=10) is None
+
+
+def test_push_out_frees_objects_among_small_borders(make_map):
+    rng = random.Random(1)
+    borders = [Rect(Point(rng.randrange(300), rng.randrange(300)), rng.randint(1, 30), rng.randint(1, 30))
+               for _ in range(300)]
+    map_ = make_map(borders)
+    for _ in range(300):
+        obj = Circle(Point(rng.randrange(300), rng.randrange(300)), False, 1, Point(0, 1), radius=rng.randint(1, 8))
+        if map_.collide_square(obj.pos.x, obj.pos.y, obj.radius):
+            assert map_.distance_field.push_out(obj, map_.collide_square)
+            assert not map_.collide_square(obj.pos.x, obj.pos.y, obj.radius)
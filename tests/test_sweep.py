@@ -0,0 +1,124 @@
+import math
+import random
+from fractions import Fraction
+
+import pytest
+
+from app.map.map_ import Rect, Point, BorderIndex
+
+
+def test_intersect_segment_degenerate():
+    rect = Rect(Point(10, 10), 5, 5)
+    assert rect.intersect_segment(Point(12, 12), Point(12, 12)) == 0
+    assert rect.intersect_segment(Point(0, 0), Point(0, 0)) is None
+    # Правый и нижний края не входят в прямоугольник
+    assert rect.intersect_segment(Point(15, 12), Point(15, 12)) is None
+
+
+def test_intersect_segment_edges():
+    rect = Rect(Point(10, 10), 5, 5)
+    # Конец отрезка ровно на левом крае - касание в t = 1
+    assert rect.intersect_segment(Point(0, 12), Point(10, 12)) == 1
+    # Вдоль правого края (не входит) - пересечения нет, вдоль левого - есть
+    assert rect.intersect_segment(Point(15, 0), Point(15, 30)) is None
+    assert rect.intersect_segment(Point(10, 0), Point(10, 30)) == Fraction(10, 30)
+    # По диагонали через угол (15, 15), не входящий в прямоугольник
+    assert rect.intersect_segment(Point(16, 14), Point(14, 16)) is None
+
+
+def test_intersect_segment_tunneling():
+    wall = Rect(Point(50, 0), 1, 100)
+    assert wall.intersect_segment(Point(0, 50), Point(100, 50)) == Fraction(1, 2)
+    assert wall.intersect_segment(Point(100, 50), Point(0, 50)) == Fraction(49, 100)
+
+
+def test_sweep_segment_zero_length_in_wall(make_map):
+    map_ = make_map([Rect(Point(10, 10), 5, 5)])
+    corner = Point(10, 10)
+    assert map_.sweep_segment(corner, Point(10, 10)) == corner
+
+
+def test_sweep_segment_free_and_blocked(make_map):
+    map_ = make_map([Rect(Point(50, 0), 1, 100)])
+    assert map_.sweep_segment(Point(0, 50), Point(49, 50)) is None
+    # Один большой шаг не проскакивает тонкую стену
+    stop = map_.sweep_segment(Point(0, 50), Point(100, 50))
+    assert stop == Point(49, 50)
+    assert not map_.collide_with_borders(stop)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_sweep_segment_matches_dense_sampling(seed, make_map):
+    rng = random.Random(seed)
+    borders = [Rect(Point(rng.randrange(100), rng.randrange(100)), rng.randint(1, 10), rng.randint(1, 10))
+               for _ in range(20)]
+    map_ = make_map(borders)
+    for _ in range(200):
+        start = Point(rng.randrange(110), rng.randrange(110))
+        if map_.collide_with_borders(start):
+            continue
+        end = Point(start.x + rng.randint(-30, 30), start.y + rng.randint(-30, 30))
+        steps = 8 * max(abs(end.x - start.x), abs(end.y - start.y), 1)
+        blocked = any(map_.collide_with_borders(Point(start.x + math.floor((end.x - start.x) * Fraction(k, steps)),
+                                                      start.y + math.floor((end.y - start.y) * Fraction(k, steps))))
+                      for k in range(steps + 1))
+        stop = map_.sweep_segment(start, end)
+        assert (stop is not None) == blocked
+        if stop is not None:
+            assert not map_.collide_with_borders(stop)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_walk_segment_visits_cells_in_order(seed):
+    # В каждой ячейке своя граница, так что по номеру границы видно, какая ячейка отдана
+    size = 8
+    cells = [(x, y) for x in range(-2, 16) for y in range(-2, 16)]
+    index = BorderIndex([Rect(Point(x * size, y * size), size, size) for x, y in cells], cell_size=size)
+    rng = random.Random(seed)
+    for _ in range(100):
+        start = Point(rng.randrange(100), rng.randrange(100))
+        end = Point(rng.randrange(100), rng.randrange(100))
+        walked, exits = [], [Fraction(0)]
+        for bucket, num, den in index.walk_segment(start, end):
+            walked.append(cells[bucket[0]])
+            exits.append(Fraction(num, den))
+        assert exits == sorted(exits) and exits[-1] >= 1
+        # Точка отрезка с параметром t лежит в ячейке, которая отдана между выходами вокруг t.
+        # Проверяются сами выходы (там углы и края ячеек), середины между ними и концы
+        samples = {Fraction(0), Fraction(1)} | {t for t in exits if t <= 1} | \
+            {(a + b) / 2 for a, b in zip(exits, exits[1:]) if b <= 1}
+        for t in samples:
+            cell = (math.floor((start.x + (end.x - start.x) * t) / size),
+                    math.floor((start.y + (end.y - start.y) * t) / size))
+            assert any(walked[j] == cell and exits[j] <= t <= exits[j + 1] for j in range(len(walked)))
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_sweep_segment_long_segments_match_single_cell_index(seed, make_map):
+    # Ранний выход из обхода не меняет ответ: индекс из одной ячейки проверяет все границы
+    rng = random.Random(seed)
+    borders = [Rect(Point(rng.randrange(1000), rng.randrange(1000)), rng.randint(1, 20), rng.randint(1, 20))
+               for _ in range(300)]
+    walked = make_map(borders)
+    single = make_map(borders, border_index=BorderIndex(borders, cell_size=1 << 20))
+    for _ in range(300):
+        start = Point(rng.randrange(-50, 1050), rng.randrange(-50, 1050))
+        end = Point(rng.randrange(-50, 1050), rng.randrange(-50, 1050))
+        assert walked.sweep_segment(start, end) == single.sweep_segment(start, end)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_sweep_segment_with_path_candidates(seed, make_map):
+    # Кандидаты на весь путь дают те же точки остановки, что и обход индекса по отрезку
+    rng = random.Random(seed)
+    borders = [Rect(Point(rng.randrange(1000), rng.randrange(1000)), rng.randint(1, 20), rng.randint(1, 20))
+               for _ in range(300)]
+    map_ = make_map(borders)
+    for _ in range(50):
+        path = [Point(rng.randrange(1000), rng.randrange(1000))]
+        for _ in range(16):
+            step = rng.choice((5, 50, 500))
+            path.append(Point(path[-1].x + rng.randint(-step, step), path[-1].y + rng.randint(-step, step)))
+        candidates = map_.border_index.query_path(path)
+        for start, end in zip(path, path[1:]):
+            assert map_.sweep_segment(start, end, candidates) == map_.sweep_segment(start, end)